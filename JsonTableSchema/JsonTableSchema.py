@@ -37,6 +37,8 @@ class JSONTableSchema(object):
       # Initialise JSONTableSchema object, optionally from a JSON string
       
       self.fields = []
+      # field name: position in fields
+      self.field_index = {}
       self.format_version = self.__format_version__
       
       if json_string is not None:
@@ -85,7 +87,7 @@ class JSONTableSchema(object):
       for key in self.required_field_descriptor_keys:      
          if not isinstance(field[key], (str, unicode)):
             raise FormatError("Field `name' must be a string")
-         if field["name"] in self.field_names:
+         if field["name"] in self.field_index:
             raise DuplicateFieldName("field 'name'")
          field_dict[key] = field[key]
       
@@ -99,14 +101,32 @@ class JSONTableSchema(object):
                
             field_dict[key] = field[key]
       
-      #TODO: Complex types, format and constraints
+      #TODO: Complex types
+      #kept for validation, which checks the constraints it knows and warns
+      #of the rest. Loading a schema doesn't fail on them
+      if isinstance(field.get("constraints"), dict):
+         field_dict["constraints"] = field["constraints"]
+
+      if isinstance(field.get("format"), (str, unicode)):
+         field_dict["format"] = field["format"]
     
+      self.field_index[field_dict["name"]] = len(self.fields)
       self.fields.append(field_dict)
 
    def remove_field(self, field_name):
-      if field_name not in self.field_names:
+      if field_name not in self.field_index:
          raise KeyError
-      self.fields = filter(lambda i: i["name"] != field_name, self.fields)
+      position = self.field_index.pop(field_name)
+      del self.fields[position]
+      # fields after the one removed move down one
+      for field in self.fields[position:]:
+         self.field_index[field["name"]]-=1
+
+   def get_field(self, field_name):
+      return self.fields[self.field_index[field_name]]
+
+   def field_position(self, field_name):
+      return self.field_index[field_name]
 
    def as_json(self):
       return json.dumps(self.as_dict(), indent=2)
@@ -124,14 +144,6 @@ class JSONTableSchema(object):
 
    def check_type(self, field_type, field_name):
   
-      type_found = False
-      for field_category in csvdatatypes.__valid_type_names__:
-         for type in field_category:
-            if field_type == type:
-               type_found = True
-               break
-      
-      if type_found != True:
+      if field_type not in csvdatatypes.__valid_types__:
          err_tmpl = "Invalid type `%s' in field descriptor for `%s'" % (field_type, field_name)
          raise FormatError(err_tmpl)
-         
\ No newline at end of file
@@ -33,4 +33,7 @@ __valid_type_names__ = [
    ["geojson"],                                                                                                         # as per <<http://http://geojson.org/>>
    ["array", "http://www.elasticsearch.org/guide/en/elasticsearch/reference/current/mapping-array-type.html"],          # an array
    ["any", "http://www.w3.org/2001/XMLSchema#anyURI"]                                                                   # value of field may be any type
-]
\ No newline at end of file
+]
+
+# every valid type name, whichever list it's from, for checking a type in one lookup
+__valid_types__ = set([type for field_category in __valid_type_names__ for type in field_category])
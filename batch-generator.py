@@ -0,0 +1,40 @@
+﻿#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+from libs.rosettacsvbatchclass import RosettaCSVBatch
+
+def rosettacsvbatch(reports, rosettaschema, configfile, outdir, workers, summary, cachedir=False):
+   csvbatch = RosettaCSVBatch(rosettaschema, configfile, outdir, workers, cachedir)
+   results = csvbatch.run(reports)
+   csvbatch.writesummary(results, summary)
+   if [result for result in results if result['error']]:
+      sys.exit(1)
+
+def main():
+
+   #	Usage: 	--reports [directory, glob or manifest of droid reports]
+   #	Handle command line arguments for the script
+   parser = argparse.ArgumentParser(description='Generate a Rosetta Ingest CSV for each of a batch of DROID CSV Reports.')
+
+   parser.add_argument('--reports', help='Directory, glob or manifest file of DROID CSVs to read.', default=False, required=True)
+   parser.add_argument('--ros', help='Rosetta CSV validation schema.', default=False, required=True)
+   parser.add_argument('--cfg', help='Config file for field mapping.', default=False, required=True)
+   parser.add_argument('--outdir', help='Directory to write a Rosetta CSV per DROID CSV to.', default=False, required=True)
+   parser.add_argument('--workers', help='Number of reports to process at once.', type=int, default=1)
+   parser.add_argument('--summary', help='JSON file to write timings and row counts to.', default=False)
+   parser.add_argument('--cache', help='Directory to keep compiled configs and schemas in, reused while they are unchanged.', default=False)
+
+   if len(sys.argv)==1:
+      parser.print_help()
+      sys.exit(1)
+
+   #	Parse arguments into namespace object to reference later in the script
+   global args
+   args = parser.parse_args()
+
+   rosettacsvbatch(args.reports, args.ros, args.cfg, args.outdir, args.workers, args.summary, args.cache)
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,125 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#Rows/second, peak RSS and per-stage timings of the whole RosettaCSVGenerator
+#pipeline, for a synthetic DROID report against every config and schema.
+#Linux only, reads peak RSS from the resource module
+#Usage: python benchmarks/generator-benchmark.py --rows 100000 [--json results.json]
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+import resource
+import multiprocessing
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from libs.RosettaCSVGenerator import RosettaCSVGenerator
+from libs.droidcsvhandlerclass import droidCSVHandler
+from syntheticdroid import writesyntheticdroid
+
+STAGES = ['compile', 'read', 'filter', 'map', 'write']
+
+#stages stream into each other so can't be timed apart in a single run,
+#instead each run adds a stage to the one before and the difference is
+#the time that stage takes
+def runstages(droidcsv, rosettaschema, configfile, outfile):
+   times = []
+   start = time.time()
+   csvgen = RosettaCSVGenerator(droidcsv, rosettaschema, configfile, outfile)
+   times.append(time.time() - start)
+
+   start = time.time()
+   for row in droidCSVHandler(csvgen.droidcolumns).streamDROIDCSVprojected(droidcsv):
+      pass
+   times.append(time.time() - start)
+
+   start = time.time()
+   for row in csvgen.readDROIDCSV():
+      pass
+   times.append(time.time() - start)
+
+   start = time.time()
+   csvgen.droidlist = csvgen.readDROIDCSV()
+   for itemrows in csvgen.createrosettacsv():
+      pass
+   times.append(time.time() - start)
+
+   csvgen = RosettaCSVGenerator(droidcsv, rosettaschema, configfile, outfile)
+   start = time.time()
+   csvgen.export2rosettacsv()
+   times.append(time.time() - start)
+
+   stagetimes = { 'compile': times[0], 'read': times[1] }
+   for i in range(2, len(STAGES)):
+      stagetimes[STAGES[i]] = max(0.0, times[i] - times[i-1])
+   return csvgen, stagetimes, times[-1]
+
+#in its own process so peak RSS is just this config and schema
+def benchmark(droidcsv, droidrows, rosettaschema, configfile, results):
+   outfile = tempfile.mktemp(suffix='.csv')
+   result = { 'config': os.path.basename(configfile), 'schema': os.path.basename(rosettaschema), 'droidrows': droidrows, 'error': '' }
+   try:
+      csvgen, stagetimes, seconds = runstages(droidcsv, rosettaschema, configfile, outfile)
+      result.update({ 'items': csvgen.itemcount, 'rows': csvgen.rowcount, 'seconds': round(seconds, 3),
+                      'rowspersecond': round(droidrows / seconds), 'stages': dict([(stage, round(t, 3)) for stage, t in stagetimes.items()]),
+                      'peakrssmb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1) })
+   except SystemExit as e:
+      #not every config fits every schema
+      result['error'] = str(e.code)
+   except Exception as e:
+      result['error'] = e.__class__.__name__ + ': ' + str(e)
+   finally:
+      if os.path.exists(outfile):
+         os.remove(outfile)
+   results.put(result)
+
+def writeresult(result):
+   name = result['config'] + ' / ' + result['schema']
+   if result['error']:
+      sys.stdout.write("%-95s skipped: %s\n" % (name, result['error']))
+      return
+   stages = ' '.join(["%s %.2fs" % (stage, result['stages'][stage]) for stage in STAGES])
+   sys.stdout.write("%-95s %8.0f rows/s %6.1fMB  %s\n" % (name, result['rowspersecond'], result['peakrssmb'], stages))
+
+def main():
+   repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+   parser = argparse.ArgumentParser(description='Benchmark Rosetta CSV generation against synthetic DROID reports.')
+   parser.add_argument('--ros', help='Rosetta CSV validation schema, repeat for more, default is every shipped schema.', action='append')
+   parser.add_argument('--cfg', help='Config file for field mapping, repeat for more, default is every shipped config.', action='append')
+   parser.add_argument('--rows', help='Number of synthetic DROID rows.', type=int, default=100000)
+   parser.add_argument('--filesperfolder', help='Files per folder, sets the ratio of folder rows.', type=int, default=50)
+   parser.add_argument('--depth', help='Depth of folders in the synthetic paths.', type=int, default=6)
+   parser.add_argument('--zipevery', help='Every nth file is a zip container, 0 for none.', type=int, default=25)
+   parser.add_argument('--zipmembers', help='Rows for the contents of each zip container.', type=int, default=10)
+   parser.add_argument('--nonascii', help='Fraction of folders with non-ASCII names.', type=float, default=0.2)
+   parser.add_argument('--json', help='Write results to a JSON file, e.g. to compare runs.', default=False)
+   args = parser.parse_args()
+
+   schemas = args.ros or sorted(glob.glob(os.path.join(repo, 'rosetta-schemas', '*.json')))
+   configs = args.cfg or sorted(glob.glob(os.path.join(repo, 'rosetta-configs', '*.cfg')))
+
+   droidcsv = tempfile.mktemp(suffix='.csv')
+   writesyntheticdroid(droidcsv, args.rows, args.filesperfolder, 1, args.depth, args.zipevery, args.zipmembers, args.nonascii)
+   allresults = []
+   try:
+      for configfile in configs:
+         for rosettaschema in schemas:
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(target=benchmark, args=(droidcsv, args.rows, rosettaschema, configfile, results))
+            process.start()
+            result = results.get()
+            process.join()
+            writeresult(result)
+            allresults.append(result)
+   finally:
+      os.remove(droidcsv)
+
+   if args.json:
+      with open(args.json, 'wb') as jsonfile:
+         json.dump({ 'arguments': vars(args), 'results': allresults }, jsonfile, indent=2)
+
+if __name__ == "__main__":
+   main()
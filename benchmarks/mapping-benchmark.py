@@ -0,0 +1,49 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#Rows/second through createrosettacsv alone, no CSV reading or output
+#Usage: python benchmarks/mapping-benchmark.py --ros [schema] --cfg [config]
+
+import os
+import sys
+import time
+import argparse
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from libs.RosettaCSVGenerator import RosettaCSVGenerator
+
+def droidrow(i):
+   folder = u'F:\\CAA\\series %d\\' % (i // 100)
+   return { u'ID': unicode(i), u'PARENT_ID': u'', u'URI': u'file:/F:/CAA/series%%20%d/file%d.pdf' % (i // 100, i),
+            u'FILE_PATH': folder + u'file%d.pdf' % i, u'NAME': u'file%d.pdf' % i, u'METHOD': u'Signature',
+            u'STATUS': u'Done', u'SIZE': u'2048', u'TYPE': u'File', u'EXT': u'pdf', u'LAST_MODIFIED': u'2014-01-02T10:00:00',
+            u'EXTENSION_MISMATCH': u'false', u'MD5_HASH': u'0cc175b9c0f1b6a831c399e269772661', u'FORMAT_COUNT': u'1',
+            u'PUID': u'fmt/18', u'MIME_TYPE': u'application/pdf', u'FORMAT_NAME': u'Acrobat PDF 1.4', u'FORMAT_VERSION': u'1.4' }
+
+def main():
+   parser = argparse.ArgumentParser(description='Benchmark Rosetta CSV field mapping.')
+   parser.add_argument('--ros', help='Rosetta CSV validation schema.', required=True)
+   parser.add_argument('--cfg', help='Config file for field mapping.', required=True)
+   parser.add_argument('--rows', help='Number of synthetic DROID rows.', type=int, default=200000)
+   parser.add_argument('--repeat', help='Number of timed runs, best is reported.', type=int, default=3)
+   args = parser.parse_args()
+
+   droidlist = [droidrow(i) for i in range(args.rows)]
+
+   best = None
+   for run in range(args.repeat):
+      csvgen = RosettaCSVGenerator(False, args.ros, args.cfg)
+      #rows are mapped as tuples of the columns the config uses
+      if run == 0:
+         droidlist = [tuple([row[column] for column in csvgen.droidcolumns]) for row in droidlist]
+      csvgen.droidlist = droidlist
+      start = time.time()
+      for itemrow in csvgen.createrosettacsv():
+         pass
+      elapsed = time.time() - start
+      if best is None or elapsed < best:
+         best = elapsed
+
+   sys.stdout.write("%d rows in %.3fs, %.0f rows/s\n" % (args.rows, best, args.rows / best))
+
+if __name__ == "__main__":
+   main()
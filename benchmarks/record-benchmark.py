@@ -0,0 +1,54 @@
+#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+#Memory held by a whole DROID report read into a list, dict per row against
+#DROIDRecord per row. Linux only, reads peak RSS from the resource module
+#Usage: python benchmarks/record-benchmark.py --rows 1000000
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import resource
+import multiprocessing
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'libs'))
+from droidcsvhandlerclass import *
+from syntheticdroid import writesyntheticdroid, DROIDHEADER
+
+#columns a typical config reads
+MAPPEDCOLUMNS = ['TYPE', 'URI', 'NAME', 'FILE_PATH', 'LAST_MODIFIED', 'MD5_HASH']
+
+def loadrows(droidcsv, columns, results):
+   before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+   start = time.time()
+   if columns:
+      rows = droidCSVHandler(columns).readDROIDCSV(droidcsv)
+   else:
+      rows = genericCSVHandler().csvaslist(droidcsv)
+   elapsed = time.time() - start
+   after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+   results.put((len(rows), elapsed, (after - before) / 1024.0))
+
+def main():
+   parser = argparse.ArgumentParser(description='Benchmark memory used per DROID row.')
+   parser.add_argument('--rows', help='Number of synthetic DROID rows.', type=int, default=1000000)
+   args = parser.parse_args()
+
+   droidcsv = tempfile.mktemp(suffix='.csv')
+   writesyntheticdroid(droidcsv, args.rows)
+   try:
+      for label, columns in [('dict, all columns', False), ('DROIDRecord, all columns', DROIDHEADER),
+                             ('DROIDRecord, mapped columns', MAPPEDCOLUMNS)]:
+         #each in its own process so peak RSS isn't shared
+         results = multiprocessing.Queue()
+         process = multiprocessing.Process(target=loadrows, args=(droidcsv, columns, results))
+         process.start()
+         rows, elapsed, megabytes = results.get()
+         process.join()
+         sys.stdout.write("%-30s %d rows, %.2fs, %.0fMB, %.0f bytes/row\n" % (label, rows, elapsed, megabytes, megabytes * 1024 * 1024 / rows))
+   finally:
+      os.remove(droidcsv)
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+#Writes synthetic DROID CSV reports for benchmarking
+
+import random
+import urllib
+import itertools
+
+DROIDHEADER = ["ID", "PARENT_ID", "URI", "FILE_PATH", "NAME", "METHOD", "STATUS", "SIZE", "TYPE", "EXT",
+               "LAST_MODIFIED", "EXTENSION_MISMATCH", "MD5_HASH", "FORMAT_COUNT", "PUID", "MIME_TYPE",
+               "FORMAT_NAME", "FORMAT_VERSION"]
+
+#ext, method, puid, mime type, format name, format version
+FORMATS = [("pdf", "Signature", "fmt/18", "application/pdf", "Acrobat PDF 1.4 - Portable Document Format", "1.4"),
+           ("doc", "Container", "fmt/40", "application/msword", "Microsoft Word Document", "97-2003"),
+           ("jpg", "Signature", "fmt/43", "image/jpeg", "JPEG File Interchange Format", "1.01"),
+           ("txt", "Extension", "x-fmt/111", "text/plain", "Plain Text File", ""),
+           ("xls", "Container", "fmt/61", "application/vnd.ms-excel", "Microsoft Excel 97 Workbook (xls)", "8")]
+
+ZIPFORMAT = ("zip", "Signature", "x-fmt/263", "application/zip", "ZIP Format", "")
+
+#stems for file and folder names, used in place of the ASCII ones for
+#the fraction of names that should be non-ASCII
+NAMES = (u"document", u"Box")
+NONASCIINAMES = [(u"dokumént", u"Boîte"), (u"Übersicht", u"Schachtel"), (u"文書", u"箱"),
+                 (u"документ", u"коробка"), (u"ñandú", u"caja")]
+
+def csvrow(values):
+   return ",".join(['"' + value + '"' for value in values]) + "\n"
+
+def pathuri(path):
+   return urllib.quote(path.replace(u"\\", u"/").encode("utf-8"), "/:")
+
+def foldervalues(id, parentid, path):
+   return [str(id), str(parentid), "file:/" + pathuri(path) + "/", path.encode("utf-8"), path.rsplit(u"\\", 1)[1].encode("utf-8"),
+           "", "Done", "", "Folder", "", "2014-01-01T10:00:00", "false", "", "", "", "", "", ""]
+
+def filevalues(id, parentid, uri, path, name, format, rand, rowtype="File"):
+   ext, method, puid, mime, formatname, version = format
+   return [str(id), str(parentid), uri, path.encode("utf-8"), name.encode("utf-8"), method, "Done",
+           str(rand.randrange(1, 10000000)), rowtype, ext, "2014-01-%02dT10:00:00" % rand.randrange(1, 29), "false",
+           "%032x" % rand.getrandbits(128), "1", puid, mime, formatname, version]
+
+#yields the rows of a transfer, a folder row followed by its files, for as
+#long as rows are asked for. Every zipevery'th file is a container followed
+#by zipmembers rows for its contents. Folders are nested depth deep
+def syntheticrows(rand, filesperfolder=50, depth=2, zipevery=0, zipmembers=10, nonascii=0.0):
+   ids = itertools.count(1)
+   for folderno in itertools.count(0):
+      filestem, folderstem = NAMES
+      if rand.random() < nonascii:
+         filestem, folderstem = NONASCIINAMES[rand.randrange(len(NONASCIINAMES))]
+      levels = [u"Level %d" % level for level in range(1, depth - 1)]
+      folder = u"\\".join([u"Z:", u"Transfer"] + levels + [u"Series %d" % (folderno // 20), u"%s %d" % (folderstem, folderno)])
+      folderid = ids.next()
+      yield foldervalues(folderid, "", folder)
+
+      for fileno in range(filesperfolder):
+         id = ids.next()
+         if zipevery and fileno % zipevery == zipevery - 1:
+            name = u"%s %d.zip" % (filestem, id)
+            path = folder + u"\\" + name
+            uri = "file:/" + pathuri(path)
+            yield filevalues(id, folderid, uri, path, name, ZIPFORMAT, rand, "Container")
+            for memberno in range(zipmembers):
+               format = FORMATS[rand.randrange(len(FORMATS))]
+               membername = u"%s %d.%s" % (filestem, memberno, format[0])
+               inner = u"content\\part %d\\%s" % (memberno // 5, membername)
+               yield filevalues(ids.next(), id, "zip:" + uri + "!/" + pathuri(inner), path + u"!\\" + inner, membername, format, rand)
+         else:
+            format = FORMATS[rand.randrange(len(FORMATS))]
+            name = u"%s %d.%s" % (filestem, id, format[0])
+            path = folder + u"\\" + name
+            yield filevalues(id, folderid, "file:/" + pathuri(path), path, name, format, rand)
+
+#rows of files in folders of filesperfolder, the folder rows included,
+#see syntheticrows for the rest of the shape of the report
+def writesyntheticdroid(fname, rows, filesperfolder=50, seed=1, depth=2, zipevery=0, zipmembers=10, nonascii=0.0):
+   rand = random.Random(seed)
+   with open(fname, 'wb') as droidcsv:
+      droidcsv.write(csvrow(DROIDHEADER))
+      for values in itertools.islice(syntheticrows(rand, filesperfolder, depth, zipevery, zipmembers, nonascii), rows):
+         droidcsv.write(csvrow(values))
@@ -3,12 +3,79 @@
 
 import os
 import sys
+import json
 import argparse
 from libs.RosettaCSVGenerator import RosettaCSVGenerator
+from libs.rosettacsvvalidatorclass import writevalidation
+from libs.droidindexclass import DROIDIndex
+from libs.rosettacsvprogressclass import RosettaCSVProgress
+from libs.rosettacsvfixityclass import RosettaCSVFixity
+from libs.droidscanclass import DROIDScan
+from libs.rosettacsvduplicatesclass import RosettaCSVDuplicates
 
-def rosettacsvgeneration(droidcsv, rosettaschema, configfile):
-   csvgen = RosettaCSVGenerator(droidcsv, rosettaschema, configfile)
-   csvgen.export2rosettacsv()
+def writeprofile(report):
+   for stage in report['stages']:
+      rate = "%.0f rows/s" % stage['rowspersecond'] if stage['rowspersecond'] else ''
+      sys.stderr.write("%-10s %9.3fs %9d in %9d out %14s\n" % (stage['stage'], stage['seconds'], stage['rowsin'], stage['rowsout'], rate))
+   sys.stderr.write("%d items, %d rows, %.3fs, peak memory %sMB\n" % (report['items'], report['rows'], report['seconds'], report['peakrssmb']))
+   if report.get('duplicates'):
+      duplicates = report['duplicates']
+      sys.stderr.write("%d duplicates of %d files, %d bytes, %d unhashed, index %sMB\n" % (duplicates['duplicates'], duplicates['indexed'],
+                       duplicates['duplicatebytes'], duplicates['unhashed'], duplicates['indexmb']))
+
+def rosettacsvgeneration(droidcsv, rosettaschema, configfile, outfile, workers, profile=False, statsfile=False, validate=False, cachedir=False, checkpoint=False, resume=False,
+                         delta=False, saveindex=False, maxfiles=None, maxbytes=None, keepfolders=None,
+                         mmapinput=False, compress=None, progress=None, statusfile=False, fixity=None, fixitycache=False,
+                         pervolume=RosettaCSVFixity.PERVOLUME, scan=False, scanthreads=DROIDScan.THREADS, duplicates=None, duplicatesreport=False):
+   csvgen = RosettaCSVGenerator(droidcsv, rosettaschema, configfile, outfile, workers, cachedir)
+   if scan:
+      if saveindex:
+         sys.exit("ERROR: Can't save an index of a scan, only of a DROID report.")
+      csvgen.scan(scanthreads)
+   if mmapinput:
+      csvgen.memorymap()
+   csvgen.outcompression = compress
+   if progress or statusfile:
+      #a status file alone is written without lines on stderr
+      csvgen.reportprogress(progress or RosettaCSVProgress.INTERVAL, statusfile, sys.stderr if progress else None)
+   if fixity:
+      #hashes are kept with the compiled configs unless asked otherwise
+      if not fixitycache and cachedir:
+         fixitycache = os.path.join(cachedir, 'fixity.tsv')
+      csvgen.computefixity(fixity, fixitycache, pervolume)
+   if duplicates or duplicatesreport:
+      #a report alone leaves duplicates in the sheet
+      csvgen.findduplicates(duplicates or RosettaCSVDuplicates.REPORT, duplicatesreport)
+   if checkpoint or resume:
+      csvgen.resumable(resume)
+   if delta:
+      csvgen.delta(delta)
+   if maxfiles or maxbytes:
+      csvgen.splitsips(maxfiles, maxbytes, keepfolders)
+   if profile or statsfile:
+      csvgen.profile()
+   if validate:
+      csvgen.validate()
+   try:
+      csvgen.export2rosettacsv()
+   finally:
+      if csvgen.deltaindex is not None:
+         csvgen.deltaindex.close()
+   #for the next run to be a delta against this one
+   if saveindex:
+      DROIDIndex(saveindex).build(droidcsv)
+   if profile or statsfile:
+      report = csvgen.statsreport()
+      if profile:
+         writeprofile(report)
+      if statsfile:
+         with open(statsfile, 'wb') as stats:
+            json.dump(report, stats, indent=2)
+   if validate:
+      report = csvgen.validator.report()
+      writevalidation(report, sys.stderr)
+      if report['violations']:
+         sys.exit("ERROR: Rosetta CSV doesn't meet the constraints in " + rosettaschema + ".")
 
 def main():
 
@@ -19,9 +86,33 @@ def main():
    #TODO: Consider optional and mandatory elements... behaviour might change depending on output...
    #other options droid csv and rosetta schema
    #NOTE: class on its own might be used to create a blank import csv with just static options
-   parser.add_argument('--csv', help='Single DROID CSV to read.', default=False, required=True)
+   parser.add_argument('--csv', help='Single DROID CSV to read.', default=False)
+   parser.add_argument('--scan', help='Directory to list instead of reading a DROID CSV.', default=False)
+   parser.add_argument('--scanthreads', help='Number of threads to list directories with.', type=int, default=DROIDScan.THREADS)
    parser.add_argument('--ros', help='Rosetta CSV validation schema.', default=False, required=True)
    parser.add_argument('--cfg', help='Config file for field mapping.', default=False, required=True)
+   parser.add_argument('--out', help='Rosetta CSV to write, default is stdout. Compressed if it ends .gz, .bz2 or .xz.', default=False)
+   parser.add_argument('--compress', help='Compress the Rosetta CSV written to stdout.', choices=['gz', 'bz2', 'xz'], default=None)
+   parser.add_argument('--workers', help='Number of processes to map DROID rows with.', type=int, default=1)
+   parser.add_argument('--profile', help='Time each stage and write a summary to stderr.', action='store_true')
+   parser.add_argument('--stats', help='Time each stage and write the figures to a JSON file.', default=False)
+   parser.add_argument('--progress', help='Report progress to stderr every so many seconds, default 5.', type=float, nargs='?', const=RosettaCSVProgress.INTERVAL, default=None)
+   parser.add_argument('--status', help='Keep progress in a JSON status file, e.g. for a scheduler.', default=False)
+   parser.add_argument('--cache', help='Directory to keep compiled configs and schemas in, reused while they are unchanged.', default=False)
+   parser.add_argument('--validate', help='Check rows against the schema constraints as they are written.', action='store_true')
+   parser.add_argument('--fixity', help='Hash files DROID left unhashed, on this many threads, default 8.', type=int, nargs='?', const=RosettaCSVFixity.THREADS, default=None)
+   parser.add_argument('--fixitycache', help='File to keep hashes in so unchanged files aren\'t hashed again, default fixity.tsv in --cache.', default=False)
+   parser.add_argument('--pervolume', help='Most files hashed at once from one volume.', type=int, default=RosettaCSVFixity.PERVOLUME)
+   parser.add_argument('--duplicates', help='Skip, report or annotate files with the hash and size of a file earlier in the report.', choices=RosettaCSVDuplicates.MODES, default=None)
+   parser.add_argument('--duplicatesreport', help='CSV to list duplicates in, with the ID of the file each is a copy of.', default=False)
+   parser.add_argument('--mmap', help='Read the DROID CSV memory mapped, faster for large reports on local disk.', action='store_true')
+   parser.add_argument('--checkpoint', help='Keep a checkpoint next to the --out sheet so an interrupted run can be resumed.', action='store_true')
+   parser.add_argument('--delta', help='Previous DROID CSV, or index saved from one, only files new or changed since are written.', default=False)
+   parser.add_argument('--saveindex', help='Save an index of this DROID CSV to a file, for a later --delta.', default=False)
+   parser.add_argument('--maxfiles', help='Split into a sheet per SIP of at most this many files, written as --out with a sheet number.', type=int, default=None)
+   parser.add_argument('--maxbytes', help='Split into a sheet per SIP of at most this many bytes of files.', type=int, default=None)
+   parser.add_argument('--keepfolders', help='With --maxfiles or --maxbytes, keep each subtree this many folders below the pathmask in one SIP, default 1, a SIP can go over the limits by a subtree.', type=int, nargs='?', const=1, default=None)
+   parser.add_argument('--resume', help='Carry on an interrupted run from its last checkpoint, appending to the --out sheet.', action='store_true')
 
    if len(sys.argv)==1:
       parser.print_help()
@@ -31,8 +122,23 @@ def main():
    global args
    args = parser.parse_args()
    
-   if args.csv and args.ros:
-      rosettacsvgeneration(args.csv, args.ros, args.cfg)
+   if args.csv and args.scan:
+      sys.exit("ERROR: Read a DROID CSV or scan a directory, not both.")
+
+   #options that would be ignored with, or without, a sheet split into SIPs
+   split = args.maxfiles or args.maxbytes
+   if args.keepfolders is not None and not split:
+      parser.error("--keepfolders needs --maxfiles or --maxbytes")
+   if args.keepfolders is not None and args.keepfolders < 1:
+      parser.error("--keepfolders needs at least one folder")
+   if args.compress and split:
+      parser.error("--compress is for stdout, compress split sheets with an --out ending .gz, .bz2 or .xz")
+
+   if (args.csv or args.scan) and args.ros:
+      rosettacsvgeneration(args.csv or args.scan, args.ros, args.cfg, args.out, args.workers, args.profile, args.stats, args.validate, args.cache, args.checkpoint, args.resume,
+                           args.delta, args.saveindex, args.maxfiles, args.maxbytes, args.keepfolders,
+                           args.mmap, args.compress, args.progress, args.status, args.fixity, args.fixitycache, args.pervolume,
+                           bool(args.scan), args.scanthreads, args.duplicates, args.duplicatesreport)
    else:
       parser.print_help()
       sys.exit(1)
@@ -1,32 +1,125 @@
 #!/usr/local/bin/python
 # -*- coding: utf-8 -*-
 
-import os
 import sys
+import copy
+import time
+import itertools
 sys.path.append(r'JsonTableSchema/')
 import ConfigParser
 import JsonTableSchema
 from droidcsvhandlerclass import *
 from rosettacsvsectionsclass import RosettaCSVSections
+from rosettacsvwriterclass import RosettaCSVWriter
+from rosettacsvplanclass import RosettaCSVPlan
+from rosettacsvshardclass import RosettaCSVShards
+from rosettacsvstatsclass import RosettaCSVStats
+from rosettacsvvalidatorclass import RosettaCSVValidator
+from rosettacsvcacheclass import RosettaCSVCache
+from rosettacsvcheckpointclass import RosettaCSVCheckpoint
+from droidindexclass import droidindex
+from rosettacsvsplitclass import RosettaCSVSplitter
+from compressedcsvclass import outputcompression
+from rosettacsvprogressclass import RosettaCSVProgress
+from rosettacsvfixityclass import RosettaCSVFixity, ALGORITHMS
+from droidscanclass import DROIDScan
+from rosettacsvgroupclass import RosettaCSVGrouper
+from rosettacsvduplicatesclass import RosettaCSVDuplicates, DUPLICATECOLUMN
 
 class RosettaCSVGenerator:
 
    includezips = False
    singleIE = False
-   
-   #flags for singleIE config
-   ieOutput = False
-   representationOutput = False
-   sectionstatusupdate = False
-   lenIE = 0
-   lenREP = 0
+
+   #an IE per directory, or per directory groupdepth folders down, the
+   #report is sorted into directories on disk, see RosettaCSVGrouper
+   groupIE = False
+   groupdepth = None
    
    #zip name we removed
    zipname = ''
 
-   def __init__(self, droidcsv=False, rosettaschema=False, configfile=False):
+   #DROID items mapped and Rosetta rows written, SIP row and header not included
+   itemcount = 0
+   rowcount = 0
+
+   #time taken by the last export2rosettacsv
+   seconds = 0.0
+
+   #DROID rows read, by class, see droidCSVHandler.filterrows
+   filtercounts = {}
+
+   #hits and misses of the mapping plan's path caches, see RosettaCSVPlan.cachestats
+   pathcachestats = {}
+
+   #per-stage timings and row counts, only collected once asked for, see profile
+   stats = None
+
+   #schema constraint checks on every row written, only once asked for, see validate
+   validator = None
+
+   #checkpoints taken while writing, and the one resumed from, see resumable
+   checkpoint = None
+   resumestate = None
+
+   #index of a previous DROID report, only files new or changed since are
+   #written, see delta
+   deltaindex = None
+
+   #writes a sheet per SIP rather than one sheet, see splitsips
+   splitter = None
+
+   #reads the DROID report memory mapped, see memorymap
+   mmapinput = False
+
+   #compression of a sheet written to stdout, gz, bz2 or xz, a sheet written
+   #to a file is compressed by its extension
+   outcompression = None
+
+   #reports how far through the DROID report we are, see reportprogress
+   progress = None
+
+   #hashes files DROID didn't, see computefixity
+   fixity = None
+
+   #lists a directory rather than reading a DROID report, see scan
+   scanner = None
+
+   #finds copies of files earlier in the report, see findduplicates
+   duplicates = None
+
+   #what __compileconfig__ sets, and the compiled config cache keeps
+   COMPILED = ['config', 'includezips', 'singleIE', 'groupIE', 'groupdepth', 'rosettacsvheader', 'rosettacsvdict', 'rosettacsvindex',
+               'rosettasections', 'mappingplan', 'droidcolumns']
+
+   def __init__(self, droidcsv=False, rosettaschema=False, configfile=False, outfile=False, workers=1, cachedir=False):
+      start = time.time()
+      self.droidcsv = droidcsv
+      self.configfile = configfile
+      self.outfile = outfile
+      self.workers = workers
+      self.rosettaschema = rosettaschema
+      self.cachedir = cachedir
+
+      #an unchanged config and schema are loaded already compiled
+      compiled = None
+      if cachedir:
+         cache = RosettaCSVCache(cachedir)
+         compiled = cache.load(configfile, rosettaschema)
+      if compiled is None:
+         self.__compileconfig__()
+         if cachedir:
+            cache.save(configfile, rosettaschema, dict([(name, getattr(self, name)) for name in self.COMPILED]))
+      else:
+         for name in self.COMPILED:
+            setattr(self, name, compiled[name])
+
+      #reading the config and schema and compiling the plan
+      self.compileseconds = time.time() - start
+
+   def __compileconfig__(self):
       self.config = ConfigParser.RawConfigParser()
-      self.config.read(configfile)   
+      self.config.read(self.configfile)   
 
       if self.config.has_option('application configuration', 'includezips'):
          self.includezips = self.__handle_text_boolean__(self.config.get('application configuration', 'includezips'))
@@ -34,16 +127,31 @@ class RosettaCSVGenerator:
       if self.config.has_option('application configuration', 'singleIE'):
          self.singleIE = self.__handle_text_boolean__(self.config.get('application configuration', 'singleIE'))
 
-      self.droidcsv = droidcsv
-      
+      if self.config.has_option('application configuration', 'groupIE'):
+         self.groupIE = self.__handle_text_boolean__(self.config.get('application configuration', 'groupIE'))
+      if self.config.has_option('application configuration', 'groupdepth'):
+         self.groupdepth = int(self.config.get('application configuration', 'groupdepth'))
+      if self.singleIE and self.groupIE:
+         sys.exit("ERROR: Config sets both singleIE and groupIE, an IE can't be one for everything and one per directory.")
+
       #NOTE: A bit of a hack, compare with import schema work and refactor
-      self.rosettaschema = rosettaschema
       self.readRosettaSchema()
       
       #Grab Rosetta Sections
-      rs = RosettaCSVSections(configfile)
+      rs = RosettaCSVSections(self.config)
       self.rosettasections = rs.sections
 
+      #Compile field mapping once, not per DROID row
+      self.mappingplan = RosettaCSVPlan(self.config, self.rosettacsvdict, self.rosettasections, self.includezips, self.singleIE, self.rosettacsvindex,
+                                        self.groupIE, self.groupdepth)
+
+      #Only the DROID columns the filters and mapping use are read
+      self.droidcolumns = list(droidCSVHandler.FILTERCOLUMNS)
+      for column in self.mappingplan.droidcolumns:
+         #added to rows once they're read, not read from the report
+         if column not in self.droidcolumns and column != DUPLICATECOLUMN:
+            self.droidcolumns.append(column)
+
    def __handle_text_boolean__(self, boolvalue):
       if boolvalue.lower() == 'true':
          return True
@@ -64,10 +172,10 @@ class RosettaCSVGenerator:
       importschema = JsonTableSchema.JSONTableSchema(importschemajson)
       
       importschemadict = importschema.as_dict()
-      importschemaheader = importschema.as_csv_header()
 
-      self.rosettacsvheader = importschemaheader + "\n"  #TODO: Add newline in JSON Handler class? 
+      self.rosettacsvheader = importschema.field_names
       self.rosettacsvdict = importschemadict['fields']
+      self.rosettacsvindex = importschema.field_index
       f.close()
 
    def createcolumns(self, columno):
@@ -76,157 +184,240 @@ class RosettaCSVGenerator:
          columns = columns + '"",'
       return columns
      
-   def csvstringoutput(self, csvlist):
-      #String output...
-      csvrows = self.rosettacsvheader
-
+   def createsiprow(self):
       #TODO: Understand how to get this in rosettacsvsectionclass
       #NOTE: Possibly put all basic RosettaCSV stuff in rosettacsvsectionclass?
       #Static ROW in CSV Ingest Sheet
-      SIPROW = ['"",'] * len(self.rosettacsvdict)
-      SIPROW[0] = '"SIP",'
-      
-      #SIP Title... 
+      SIPROW = ['""'] * len(self.rosettacsvdict)
+      SIPROW[0] = '"SIP"'
+
+      #SIP Title...
       if self.config.has_option('rosetta mapping', 'SIP Title'):
-         SIPROW[1] = '"' + self.config.get('rosetta mapping', 'SIP Title') + '",'
+         SIPROW[1] = '"' + self.config.get('rosetta mapping', 'SIP Title') + '"'
       else:
-         SIPROW[1] = '"CSV Load",'
-     
-      csvrows = csvrows + ''.join(SIPROW).rstrip(',') + '\n'
-      
-      for sectionrows in csvlist:
-         rowdata = ""
-         for sectionrow in sectionrows:
-            for fielddata in sectionrow:
-               rowdata = rowdata + fielddata + ','
-            rowdata = rowdata.rstrip(',') + '\n'
-         csvrows = csvrows + rowdata
-         
-      #this is the best i can think of because ExLibris have named two fields with the same
-      #title in CSV which doesn't help us when we're trying to use unique names for populating rows
-      #replaces SIP Title with Title (DC)
-      csvrows = csvrows.replace('"Object Type","SIP Title"','"Object Type","Title (DC)"')
-      
-      #finally output CSV
-      sys.stdout.write(csvrows)         
-      
-   #TODO: Passed each time we go through the code, improve on this: DO ONCE!
-   def __update_section_status__(self, section):
-   
-      sect = self.__get_section_key__(section)
-   
-      if self.singleIE == True and sect == 'IE':
-         self.ieOutput = True
-         self.lenIE = len(section.values()[0])
-      if self.singleIE == True and sect == 'REPRESENTATION':
-         self.representationOutput = True
-         self.lenREP = len(section.values()[0])
-
-      #One method of only visiting this function only as many times as required...
-      if self.ieOutput == True and self.representationOutput == True:
-         return True
+         SIPROW[1] = '"CSV Load"'
+      return SIPROW
+
+   #a generator for another DROID report that shares this one's parsed
+   #config, schema and compiled mapping plan, e.g. for batches of reports
+   def forreport(self, droidcsv, outfile=False):
+      csvgen = copy.copy(self)
+      csvgen.mappingplan = copy.copy(self.mappingplan)
+      csvgen.droidcsv = droidcsv
+      csvgen.outfile = outfile
+      csvgen.zipname = ''
+      csvgen.itemcount = 0
+      csvgen.rowcount = 0
+      csvgen.filtercounts = {}
+      csvgen.pathcachestats = {}
+      csvgen.stats = None
+      csvgen.validator = None
+      csvgen.checkpoint = None
+      csvgen.resumestate = None
+      csvgen.deltaindex = None
+      csvgen.splitter = None
+      csvgen.progress = None
+      csvgen.fixity = None
+      csvgen.scanner = None
+      csvgen.duplicates = None
+      return csvgen
+
+   #turns on per-stage timings and row counts for export2rosettacsv, see
+   #RosettaCSVStats. Returns the stats so hooks can be added to them
+   def profile(self):
+      if self.stats is None:
+         self.stats = RosettaCSVStats()
+         self.stats.add('compile', self.compileseconds)
+      return self.stats
+
+   #checks every row written against the schema constraints, violations
+   #are left in the validator's report
+   def validate(self):
+      if self.validator is None:
+         self.validator = RosettaCSVValidator(self.rosettacsvdict)
+      return self.validator
+
+   #takes a checkpoint every so many items written, so an interrupted run can
+   #be resumed, see RosettaCSVCheckpoint. If resume is set, carries on from
+   #the last checkpoint taken, appending to the sheet already written
+   def resumable(self, resume=False):
+      if self.scanner is not None:
+         sys.exit("ERROR: Can't checkpoint a scan, only the reading of a DROID report.")
+      if not self.outfile:
+         sys.exit("ERROR: Can't checkpoint a Rosetta CSV written to stdout, use --out.")
+      if outputcompression(self.outfile):
+         sys.exit("ERROR: Can't checkpoint a compressed Rosetta CSV, it can't be cut back to a checkpoint.")
+      self.checkpoint = RosettaCSVCheckpoint(self.outfile, self.droidcsv, self.rosettaschema, self.configfile)
+      if resume:
+         self.resumestate = self.checkpoint.load()
+
+   #where the next DROID row starts, and everything needed to carry on from it
+   def __takecheckpoint__(self, csvwriter, inputoffset):
+      self.checkpoint.save({ 'inputoffset': inputoffset, 'outputoffset': csvwriter.sync(), 'itemcount': self.itemcount,
+                             'rowcount': csvwriter.rowcount, 'zipname': self.zipname, 'filtercounts': self.filtercounts })
+
+   #a resumed sheet already has its header, SIP row and first item
+   def __resumewriter__(self):
+      state = self.resumestate
+      csvwriter = RosettaCSVWriter(self.outfile, state['outputoffset'])
+      csvwriter.rowcount = state['rowcount']
+      self.itemcount = state['itemcount']
+      return csvwriter
+
+   #only files new or changed since a previous DROID report are written,
+   #previous is the report or an index built from it, see DROIDIndex. The
+   #columns a file is compared by are read along with the rest
+   def delta(self, previous):
+      if self.scanner is not None:
+         sys.exit("ERROR: A scan can't be compared with a previous DROID report.")
+      self.deltaindex = droidindex(previous)
+      self.deltacolumns = self.deltaindex.columns(self.droidcsv)
+      self.droidcolumns = self.droidcolumns + [column for column in self.deltacolumns if column not in self.droidcolumns]
+
+   #reports rows read, throughput, bytes read and time left every interval
+   #seconds while generating, to out and/or a JSON statusfile, see
+   #RosettaCSVProgress
+   def reportprogress(self, interval=RosettaCSVProgress.INTERVAL, statusfile=False, out=sys.stderr):
+      self.progress = RosettaCSVProgress(self, interval, statusfile, out)
+      return self.progress
+
+   #fills in the hash column the config maps where DROID left it empty, by
+   #hashing the files on threads threads, at most pervolume at once from a
+   #volume, see RosettaCSVFixity. Hashes are kept in cachefile, so files
+   #unchanged since an earlier run aren't hashed again
+   def computefixity(self, threads=RosettaCSVFixity.THREADS, cachefile=False, pervolume=RosettaCSVFixity.PERVOLUME):
+      hashcolumns = [column for column in self.mappingplan.droidcolumns if column in ALGORITHMS]
+      if len(hashcolumns) == 0:
+         sys.exit("ERROR: Config doesn't map a DROID hash column, one of " + ', '.join(sorted(ALGORITHMS)) + ", there's no fixity to compute.")
+      self.fixity = RosettaCSVFixity(hashcolumns[0], threads, cachefile, pervolume)
+      if 'FILE_PATH' not in self.droidcolumns:
+         self.droidcolumns = self.droidcolumns + ['FILE_PATH']
+      return self.fixity
+
+   #droidcsv is a directory, listed as DROID would list it rather than read
+   #from a DROID report, so the config's DROID mappings work as they are.
+   #Folders are listed on threads threads, see DROIDScan
+   def scan(self, threads=DROIDScan.THREADS):
+      if self.workers > 1:
+         sys.exit("ERROR: A scan is listed on threads of its own, use --workers 1.")
+      self.scanner = DROIDScan(self.droidcsv, threads)
+      return self.scanner
+
+   #finds files with the hash and size of a file earlier in the report, and
+   #skips them, reports them to reportfile, or annotates them in a
+   #DUPLICATE_OF column the config can map, see RosettaCSVDuplicates. The
+   #hash is the one the config maps, or MD5_HASH, computed if fixity is
+   def findduplicates(self, mode=RosettaCSVDuplicates.SKIP, reportfile=False):
+      if self.workers > 1:
+         sys.exit("ERROR: Duplicates are found across the whole report, use --workers 1.")
+      if mode == RosettaCSVDuplicates.REPORT and not reportfile:
+         sys.exit("ERROR: Duplicates need a report file to be reported to.")
+      hashcolumns = [column for column in self.mappingplan.droidcolumns if column in ALGORITHMS] + ['MD5_HASH']
+      self.duplicates = RosettaCSVDuplicates(hashcolumns[0], mode, reportfile)
+      self.droidcolumns = self.droidcolumns + [column for column in self.duplicates.columns() if column not in self.droidcolumns]
+      return self.duplicates
+
+   #the columns of rows once they're read, those read from the report and
+   #any added to them, what the mapping is bound to
+   def rowcolumns(self):
+      if self.duplicates is not None:
+         return self.duplicates.rowcolumns(self.droidcolumns)
+      return self.droidcolumns
+
+   #reads the DROID report memory mapped rather than through a file object,
+   #and splits it into shards by counting quotes over the mapping, see
+   #MappedCSV. Checkpointed runs still read a line at a time
+   def memorymap(self):
+      self.mmapinput = True
+
+   #writes a sheet per SIP of at most maxfiles items and maxbytes of DROID
+   #SIZE, and a manifest of the sheets, see RosettaCSVSplitter. keepfolders
+   #is how many folders below the pathmask make a subtree kept in one SIP
+   def splitsips(self, maxfiles=None, maxbytes=None, keepfolders=None):
+      if not self.outfile:
+         sys.exit("ERROR: Can't split SIPs written to stdout, use --out.")
+      self.splitter = RosettaCSVSplitter(self, maxfiles, maxbytes, keepfolders)
+      columns = ['SIZE']
+      if keepfolders:
+         columns.append(self.mappingplan.groupcolumn())
+      self.droidcolumns = self.droidcolumns + [column for column in columns if column not in self.droidcolumns]
+      return self.splitter
+
+   #hook is called with (stage, figures) for each stage once the run is
+   #over, then with ('run', report), e.g. to feed our own metrics collector
+   def addhook(self, hook):
+      self.profile().hooks.append(hook)
+
+   #the JSON-able profile of the last export2rosettacsv
+   def statsreport(self):
+      if self.stats is not None:
+         return self.stats.report({ 'droidcsv': self.droidcsv, 'rosettaschema': self.rosettaschema, 'configfile': self.configfile,
+                                    'workers': self.workers, 'seconds': round(self.seconds, 4), 'items': self.itemcount,
+                                    'rows': self.rowcount, 'filtercounts': self.filtercounts, 'pathcachestats': self.pathcachestats,
+                                    'validation': self.validator.report() if self.validator is not None else None,
+                                    'fixity': self.fixity.counts if self.fixity is not None else None,
+                                    'duplicates': self.duplicates.counts if self.duplicates is not None else None })
+
+   #rows are passed through untouched if we're not profiling
+   def __timed__(self, stage, rows, includes=None):
+      if self.stats is None:
+         return rows
+      return self.stats.timed(stage, rows, includes)
+
+   #csvlist can be any iterable of item rows, e.g. the createrosettacsv generator
+   #rows are written as they arrive so the sheet is never held in memory
+   def csvoutput(self, csvlist):
+      if self.resumestate is not None:
+         csvwriter = self.__resumewriter__()
       else:
-         return False
- 
-   def __get_section_key__(self, section):
-      return section.keys()[0]
+         csvwriter = RosettaCSVWriter(self.outfile, compressed=self.outcompression)
+      try:
+         if self.resumestate is None:
+            csvwriter.writeheader(self.rosettacsvheader)
+            siprow = self.createsiprow()
+            if self.validator is not None:
+               self.validator.checkrow(siprow, True)
+            csvwriter.writerow(siprow)
+         if self.checkpoint is None:
+            for sectionrows in csvlist:
+               csvwriter.writerows(sectionrows)
+         else:
+            #rows are pulled through one item at a time, the reader has only
+            #read as far as the item just written
+            lines = self.droidcsvhandler.lines
+            for sectionrows in csvlist:
+               csvwriter.writerows(sectionrows)
+               if self.itemcount % self.checkpoint.CHECKPOINTITEMS == 0:
+                  self.__takecheckpoint__(csvwriter, lines.pos)
+      finally:
+         csvwriter.close()
+      self.rowcount = csvwriter.rowcount - 1
+      if self.checkpoint is not None:
+         self.checkpoint.remove()
 
+   #generator, yields the rows for each DROID item as it is mapped
    def createrosettacsv(self):
-      
-      CSVINDEXSTARTPOS = 2
-      csvindex = CSVINDEXSTARTPOS
-      
-      fields = []
+      self.mappingplan.bind(self.zipname, self.rowcolumns())
+      maprow = self.mappingplan.maprow
+
+      #IE and REPRESENTATION for a group are output with its first item
+      if self.groupIE:
+         groupkey = self.mappingplan.groupkeyfunction(self.droidcolumns)
+         lastkey = None
+         for item in self.droidlist:
+            key = groupkey(item)
+            self.itemcount+=1
+            yield maprow(item, key != lastkey)
+            lastkey = key
+         return
 
+      #IE and REPRESENTATION for a single IE are output with the first item,
+      #already written if we're resuming
+      first = self.resumestate is None
       for item in self.droidlist:
-         itemrow = []
-         
-         for sections in self.rosettasections:
-            
-            #TODO: Could be more intuitive
-            #IF relates to single IE for the file or not... IF 'not', then we don't output IE and REP for a single IE
-            if not (self.sectionstatusupdate == True and (self.__get_section_key__(sections) == 'REPRESENTATION' or self.__get_section_key__(sections) == 'IE')):
-           
-               sectionrow = ['""'] * len(self.rosettacsvdict)
-               sectionrow[0] = self.add_csv_value(sections.keys()[0])
-               
-               #ROW OUTPUT LOOP STARTS
-               for field in sections[sections.keys()[0]]:
-               
-                  if field == self.rosettacsvdict[csvindex]['name']:
-
-                     if self.config.has_option('rosetta mapping', field):
-                     
-                        if field == 'Title' or field == 'Title(DC)':       #Title(DC) added for future configuration
-                           if self.includezips == True and self.singleIE == True:
-                              if self.config.has_option('application configuration', 'ziptitle'):
-                                 addvalue = self.config.get('application configuration', 'ziptitle')
-                              else:
-                                 addvalue = self.zipname
-                           elif self.singleIE == True:
-                              addvalue = self.config.get('rosetta mapping', field)
-                           else:
-                              rosettafield = self.config.get('rosetta mapping', field)
-                              addvalue = item[rosettafield]
-                        else:
-                           rosettafield = self.config.get('rosetta mapping', field)
-                           addvalue = item[rosettafield]
-                           
-                        sectionrow[csvindex] = self.add_csv_value(addvalue)
-                     
-                     elif self.config.has_option('static values', field):
-                        rosettafield = self.config.get('static values', field)
-                        sectionrow[csvindex] = self.add_csv_value(rosettafield)
-                        
-                     elif self.config.has_option('droid mapping', field): 
-                        rosettafield = self.config.get('droid mapping', field)
-                        
-                        #get pathmask for location values...
-                        #TODO: Only need to do this once somewhere... e.g. Constructor
-                        pathmask = ""
-                        if self.config.has_option('path values', 'pathmask'):
-                           pathmask = self.config.get('path values', 'pathmask')
-
-                           addvalue = item[rosettafield]
-
-                           if field == 'File Location' or field == 'File Original Path':
-                              if not self.includezips:
-                                 basedirname = os.path.dirname(item[rosettafield]) + '\\'
-                                 addvalue = basedirname.replace(pathmask, '').replace('\\','/') 
-                                 #TODO: Test against other cases, workaround for no directory structure in ZIP
-                                 if addvalue == '/' and len(addvalue) == 1:
-                                    addvalue = ""
-                              else:
-                                 path = item['URI']
-                                 addvalue = "/".join(urlparse(path).path.split('/')[1:-1]).replace(pathmask, '').replace('\\','/') + '/'
-                           #if field == 'File Original Path':
-                           #   addvalue = item[rosettafield].replace(pathmask, '').replace('\\','/')
-
-                        sectionrow[csvindex] = self.add_csv_value(addvalue)
-                     else:                     
-                        #If we haven't a value, add a blank field...
-                        sectionrow[csvindex] = self.add_csv_value("")
-
-                     csvindex+=1
-
-               itemrow.append(sectionrow)
-               #ROW OUTPUT LOOP ENDS
-
-            #Need to know to output sections if we have a single IE
-            if not self.sectionstatusupdate and self.singleIE:
-               self.sectionstatusupdate = self.__update_section_status__(sections)
-         
-         #add row to sheet
-         fields.append(itemrow)
-
-         #reset field entry point, default two represents Object Type and SIP Title (see schema)
-         csvindex=CSVINDEXSTARTPOS
-         if self.singleIE:
-            number_of_empty_fields = CSVINDEXSTARTPOS + self.lenIE + self.lenREP
-            #len IE + Len REP? 
-            csvindex=number_of_empty_fields
-
-      self.csvstringoutput(fields)
+         self.itemcount+=1
+         yield maprow(item, first)
+         first = False
 
    def readExportCSV(self):
       if self.exportsheet != False:
@@ -234,31 +425,147 @@ class RosettaCSVGenerator:
          exportlist = csvhandler.csvaslist(self.exportsheet)
          return exportlist
    
+   def __ziptitlerequired__(self):
+      return self.includezips and self.singleIE and not self.config.has_option('application configuration', 'ziptitle')
+
+   #folder and container filtering, one pass applied lazily to any iterable
+   #of rows. Counts of each class of row are left in self.filtercounts
+   def filterDROIDrows(self, droidcsvhandler, droidlist):
+      self.filtercounts = droidcsvhandler.counts
+      droidlist = droidcsvhandler.filterrows(droidlist, self.includezips)
+      if self.deltaindex is not None:
+         droidlist = self.deltaindex.changedrows(droidlist, self.droidcolumns, self.deltacolumns, self.filtercounts)
+      return droidlist
+
+   #returns a generator of filtered DROID rows, the report is streamed through
+   #each filter stage so memory use doesn't depend on the size of the report
    def readDROIDCSV(self):
       if self.droidcsv != False:
-         droidcsvhandler = droidCSVHandler()
-         droidlist = droidcsvhandler.readDROIDCSV(self.droidcsv)
-         droidlist = droidcsvhandler.removefolders(droidlist)
-         if not self.includezips:         
-            droidlist = droidcsvhandler.removecontainercontents(droidlist)
-         
-         #TODO: Move to DROIDCSVHANDLER Class
-         if self.includezips:
-            newlist = []
-            for d in droidlist:
-               if droidcsvhandler.getURIScheme(d['URI']) != 'file':
-                  newlist.append(d)
-               else:
-                  self.zipname = d['NAME']
-                  
-            droidlist=newlist
-
-         if len(droidlist) == 0:
-            sys.exit("ERROR: Listing empty. Check ingest from ZIP settings, or contents of DROID report.")
-
-         return droidlist      
+         droidcsvhandler = droidCSVHandler(self.droidcolumns)
+         state = self.resumestate
+
+         #single IE title is the zip name, output with the first row, so find it first
+         if state is not None:
+            self.zipname = droidcsvhandler.zipname = state['zipname']
+            droidcsvhandler.counts.update(state['filtercounts'])
+         elif self.__ziptitlerequired__() and self.scanner is None:
+            self.zipname = self.__findzipname__(droidcsvhandler)
+
+         if self.scanner is not None:
+            droidlist = self.scanner.rows(self.droidcolumns, droidcsvhandler.recordtype)
+         elif self.checkpoint is not None:
+            #files are read ahead to be hashed, past where a checkpoint would be
+            if self.fixity is not None:
+               sys.exit("ERROR: Can't checkpoint while computing fixity.")
+            #files seen before the checkpoint aren't kept with it
+            if self.duplicates is not None:
+               sys.exit("ERROR: Can't checkpoint while finding duplicates.")
+            #the whole report is read before the first directory is written
+            if self.groupIE:
+               sys.exit("ERROR: Can't checkpoint an IE per directory.")
+            #checkpoints need to know how far through the report we are
+            self.droidcsvhandler = droidcsvhandler
+            droidlist = droidcsvhandler.streamDROIDCSVfrom(self.droidcsv, state['inputoffset'] if state is not None else None)
+         elif self.mmapinput:
+            if self.progress is not None:
+               self.progress.countrows(droidcsvhandler.csvhandler)
+            droidlist = droidcsvhandler.streamDROIDCSVmapped(self.droidcsv)
+         else:
+            droidlist = droidcsvhandler.streamDROIDCSVprojected(self.droidcsv)
+         if self.progress is not None:
+            droidlist = self.progress.track(droidlist, droidcsvhandler.bytesread)
+         droidlist = self.__timed__('read', droidlist)
+         droidlist = self.__timed__('filter', self.filterDROIDrows(droidcsvhandler, droidlist), 'read')
+         stage = 'filter'
+         if self.fixity is not None:
+            droidlist = self.__timed__('fixity', self.fixity.hashrows(droidlist, self.droidcolumns), stage)
+            stage = 'fixity'
+         if self.duplicates is not None:
+            recordtype = droidrecordtype(self.rowcolumns())
+            droidlist = self.__timed__('duplicates', self.duplicates.duplicaterows(droidlist, self.droidcolumns, recordtype), stage)
+            stage = 'duplicates'
+         if self.groupIE:
+            grouper = RosettaCSVGrouper(self.mappingplan.groupkeyfunction(self.droidcolumns))
+            droidlist = self.__timed__('group', grouper.groupedrows(droidlist), stage)
+
+         try:
+            firstrow = self.__firstrow__(droidlist)
+         except StopIteration:
+            #the last checkpoint may have been taken after the last item
+            if state is not None:
+               return iter([])
+            self.__listingempty__()
+
+         if state is None and not self.__ziptitlerequired__():
+            self.zipname = droidcsvhandler.zipname
+
+         return itertools.chain([firstrow], droidlist)
+
+   #the first row is read before mapping starts, with an IE per directory
+   #that's the whole report sorted. The wait is in the time of every stage
+   #reading, so it's counted to mapping and the stages after it too, or
+   #theirs would be short of it
+   def __firstrow__(self, droidlist):
+      if self.stats is None:
+         return next(droidlist)
+      start = time.time()
+      try:
+         return next(droidlist)
+      finally:
+         seconds = time.time() - start
+         laststage = 'map'
+         self.stats.add('map', seconds, 0, 0, self.readstage())
+         if self.validator is not None:
+            self.stats.add('validate', seconds, 0, 0, 'map')
+            laststage = 'validate'
+         self.stats.add('write', seconds, 0, 0, laststage)
+
+   #the last stage of reading, the stage mapping reads its rows from
+   def readstage(self):
+      if self.groupIE:
+         return 'group'
+      if self.duplicates is not None:
+         return 'duplicates'
+      if self.fixity is not None:
+         return 'fixity'
+      return 'filter'
+
+   def __findzipname__(self, droidcsvhandler):
+      if self.stats is None:
+         return droidcsvhandler.findzipname(self.droidcsv)
+      self.stats.start('zipname')
+      zipname = droidcsvhandler.findzipname(self.droidcsv)
+      self.stats.stop('zipname')
+      return zipname
+
+   def __listingempty__(self):
+      if self.deltaindex is not None:
+         sys.exit("ERROR: Listing empty. Nothing new or changed since the previous DROID report.")
+      sys.exit("ERROR: Listing empty. Check ingest from ZIP settings, or contents of DROID report.")
 
    def export2rosettacsv(self):
       if self.droidcsv != False:
-         self.droidlist = self.readDROIDCSV()
-         self.createrosettacsv()
+         if DUPLICATECOLUMN in self.mappingplan.droidcolumns and (self.duplicates is None or self.duplicates.mode != RosettaCSVDuplicates.ANNOTATE):
+            sys.exit("ERROR: Config maps " + DUPLICATECOLUMN + ", duplicates need to be found and annotated for it.")
+         start = time.time()
+         if self.splitter is not None:
+            self.splitter.export2rosettacsv()
+         elif self.workers > 1:
+            RosettaCSVShards(self, self.workers).export2rosettacsv()
+         else:
+            self.droidlist = self.readDROIDCSV()
+            rosettarows = self.__timed__('map', self.createrosettacsv(), self.readstage())
+            laststage = 'map'
+            if self.validator is not None:
+               rosettarows = self.__timed__('validate', self.validator.checkitems(rosettarows), 'map')
+               laststage = 'validate'
+            if self.stats is None:
+               self.csvoutput(rosettarows)
+            else:
+               self.stats.start('write')
+               self.csvoutput(rosettarows)
+               self.stats.stop('write', 0, self.rowcount, laststage)
+            self.pathcachestats = self.mappingplan.cachestats()
+         self.seconds = time.time() - start
+         if self.progress is not None:
+            self.progress.finish()
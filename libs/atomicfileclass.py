@@ -0,0 +1,10 @@
+import os
+
+#moves a file written in full, e.g. to a temporary name beside it, over
+#filename, so a reader sees either the old file or the new one. A rename
+#replaces the old file in one step everywhere but Windows, where rename
+#won't replace a file so the old one has to be removed first
+def replacefile(tmpname, filename):
+   if os.name == 'nt' and os.path.exists(filename):
+      os.remove(filename)
+   os.rename(tmpname, filename)
@@ -0,0 +1,107 @@
+import io
+import os
+import bz2
+import sys
+import gzip
+try:
+   import lzma
+except ImportError:
+   try:
+      from backports import lzma
+   except ImportError:
+      #no xz support without backports.lzma on Python 2
+      lzma = None
+
+#DROID reports are recognised as compressed by their first bytes, sheets
+#we write are compressed by the extension they are given
+MAGIC = [('\x1f\x8b', 'gz'), ('BZh', 'bz2'), ('\xfd7zXZ\x00', 'xz')]
+EXTENSIONS = { '.gz': 'gz', '.bz2': 'bz2', '.xz': 'xz' }
+
+#buffer for compressed streams, they are read and written in large blocks
+BUFFERSIZE = 1024 * 1024
+
+#gzip's own default, 9 is much slower for little gain on CSV
+GZIPLEVEL = 6
+
+#the compression a file is in, or None
+def compression(fname):
+   with open(fname, 'rb') as f:
+      start = f.read(6)
+   for magic, compressed in MAGIC:
+      if start.startswith(magic):
+         return compressed
+   return None
+
+#the compression a file should be written in, from its extension, or None
+def outputcompression(fname):
+   return EXTENSIONS.get(os.path.splitext(fname)[1].lower())
+
+#the name without a compression extension, e.g. report.csv for report.csv.gz
+def uncompressedname(fname):
+   root, ext = os.path.splitext(fname)
+   if ext.lower() in EXTENSIONS:
+      return root
+   return fname
+
+def __lzma__():
+   if lzma is None:
+      sys.exit("ERROR: Reading and writing .xz needs the backports.lzma module.")
+   return lzma
+
+#opens a CSV for reading, decompressing as it is read if it is compressed.
+#gzip and lzma files read lines in Python, a buffered reader over them
+#reads lines in C from large decompressed blocks
+def opencsv(csvfname):
+   compressed = compression(csvfname)
+   if compressed == 'gz':
+      return io.BufferedReader(gzip.GzipFile(csvfname, 'rb'), BUFFERSIZE)
+   if compressed == 'bz2':
+      return bz2.BZ2File(csvfname, 'rb', BUFFERSIZE)
+   if compressed == 'xz':
+      return io.BufferedReader(__lzma__().LZMAFile(csvfname, 'rb'), BUFFERSIZE)
+   return open(csvfname, 'rb')
+
+#opens a CSV for writing, or writes to out, e.g. stdout, compressed as it
+#is written. Small writes are buffered and compressed a block at a time
+def opencsvoutput(outfile=False, compressed=None, out=None):
+   if outfile:
+      compressed = outputcompression(outfile)
+   if compressed == 'gz':
+      if outfile:
+         return io.BufferedWriter(gzip.GzipFile(outfile, 'wb', GZIPLEVEL), BUFFERSIZE)
+      return io.BufferedWriter(gzip.GzipFile(fileobj=out, mode='wb', compresslevel=GZIPLEVEL), BUFFERSIZE)
+   if compressed == 'bz2':
+      if outfile:
+         return io.BufferedWriter(BZ2Stream(open(outfile, 'wb'), True), BUFFERSIZE)
+      return io.BufferedWriter(BZ2Stream(out), BUFFERSIZE)
+   if compressed == 'xz':
+      if outfile:
+         return io.BufferedWriter(__lzma__().LZMAFile(outfile, 'wb'), BUFFERSIZE)
+      return io.BufferedWriter(__lzma__().LZMAFile(out, 'wb'), BUFFERSIZE)
+   if outfile:
+      return open(outfile, 'wb', BUFFERSIZE)
+   return out
+
+#bz2 on Python 2 can only write to a file by name, and has no flush, this
+#compresses to a file object, e.g. stdout, closing it too if closeout is set
+class BZ2Stream(io.RawIOBase):
+
+   def __init__(self, out, closeout=False):
+      self.out = out
+      self.closeout = closeout
+      self.compressor = bz2.BZ2Compressor()
+
+   def writable(self):
+      return True
+
+   def write(self, data):
+      self.out.write(self.compressor.compress(data.tobytes() if isinstance(data, memoryview) else data))
+      return len(data)
+
+   def close(self):
+      if not self.closed:
+         self.out.write(self.compressor.flush())
+         self.out.flush()
+         if self.closeout:
+            self.out.close()
+      io.RawIOBase.close(self)
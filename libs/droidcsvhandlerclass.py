@@ -1,20 +1,77 @@
-﻿import unicodecsv
+﻿import os
+import sys
+import csv
+import collections
+import unicodecsv
 from urlparse import urlparse
+from droidcsvmapclass import MappedCSV
+from compressedcsvclass import opencsv
+
+#DROID columns with few distinct values across a report, each distinct
+#value is decoded and held once and shared by every row that has it
+INTERNCOLUMNS = ['PARENT_ID', 'METHOD', 'STATUS', 'TYPE', 'EXT', 'EXTENSION_MISMATCH',
+                 'FORMAT_COUNT', 'PUID', 'MIME_TYPE', 'FORMAT_NAME', 'FORMAT_VERSION']
+
+#stop adding to a column's intern table if it turns out not to repeat
+INTERNLIMIT = 10000
+
+#compact, immutable row of just the projected columns, a tuple underneath
+#so can be indexed by position, or read by attribute, e.g. row.FILE_PATH
+def droidrecordtype(columns):
+   return collections.namedtuple('DROIDRecord', [str(column) for column in columns], rename=True)
+
+#lines of a file from a byte offset, to an end offset if given, keeping the
+#offset reached so a reader of the rows can tell where the rows it has had
+#so far end, e.g. to take a checkpoint
+class csvlinereader():
+
+   def __init__(self, csvfile, start, end=None):
+      csvfile.seek(start)
+      self.csvfile = csvfile
+      self.pos = start
+      self.end = end
+
+   def __iter__(self):
+      return self
+
+   def next(self):
+      if self.end is not None and self.pos >= self.end:
+         raise StopIteration
+      line = self.csvfile.readline()
+      if not line:
+         raise StopIteration
+      self.pos += len(line)
+      return line
 
 class genericCSVHandler():
 
+   #the file the last generator opened is reading, see bytesread
+   readingfile = None
+
+   # how far through the file being read we are, in bytes as stored, so
+   # compressed bytes for a compressed file. None if it can't be told
+   def bytesread(self):
+      if self.readingfile is None:
+         return None
+      if isinstance(self.readingfile, MappedCSV):
+         return self.readingfile.mapped.tell() if self.readingfile.mapped is not None else None
+      try:
+         #the position of the file underneath any buffering or decompression
+         return os.lseek(self.readingfile.fileno(), 0, os.SEEK_CUR)
+      except (AttributeError, IOError, OSError):
+         return None
+
    def __getCSVheaders__(self, csvcolumnheaders):
       header_list = []
       for header in csvcolumnheaders:      
          header_list.append(header)
       return header_list
 
-   # returns list of rows, each row is a dictionary
-   # header: value, pair. 
-   def csvaslist(self, csvfname):
+   # yields rows one at a time, each row is a dictionary
+   # header: value, pair. File is only held open while iterating.
+   def csvasgenerator(self, csvfname):
       columncount = 0
-      csvlist = []
-      with open(csvfname, 'rb') as csvfile:
+      with opencsv(csvfname) as csvfile:
          csvreader = unicodecsv.reader(csvfile)
          for row in csvreader:
             if csvreader.line_num == 1:		# not zero-based index
@@ -26,40 +83,289 @@ class genericCSVHandler():
                #note: don't need ID data. Ignoring multiple ID.
                for i in range(columncount):
                   csv_dict[header_list[i]] = row[i]
-               csvlist.append(csv_dict)
-      return csvlist
+               yield csv_dict
+
+   # returns list of rows, each row is a dictionary
+   # header: value, pair.
+   def csvaslist(self, csvfname):
+      return list(self.csvasgenerator(csvfname))
+
+   # returns the header list and the byte offset of the first data row
+   def csvheader(self, csvfname):
+      with opencsv(csvfname) as csvfile:
+         headerline = csvfile.readline()
+      header_list = self.__getCSVheaders__(unicodecsv.reader([headerline]).next())
+      return header_list, len(headerline)
+
+   # splits the data rows into byte ranges of roughly chunksize, each range
+   # starting and ending on a row boundary. A newline inside a quoted value
+   # leaves an odd number of quotes on the line, so we track quote parity.
+   # Starts after the header, or at start, which must be a row boundary
+   def csvrowranges(self, csvfname, chunksize, start=None):
+      header_list, headerend = self.csvheader(csvfname)
+      if start is None:
+         start = headerend
+      ranges = []
+      with opencsv(csvfname) as csvfile:
+         csvfile.seek(start)
+         pos = start
+         inquotes = False
+         for line in csvfile:
+            pos += len(line)
+            if line.count('"') % 2:
+               inquotes = not inquotes
+            if not inquotes and pos - start >= chunksize:
+               ranges.append((start, pos))
+               start = pos
+      if pos > start:
+         ranges.append((start, pos))
+      return ranges
+
+   # positions in the header of the columns asked for
+   def csvprojection(self, csvfname, header_list, columns):
+      indexes = []
+      for column in columns:
+         if column not in header_list:
+            sys.exit("ERROR: Column '" + column + "' not found in " + csvfname + ". Check config mapping against the CSV.")
+         indexes.append(header_list.index(column))
+      return indexes
+
+   # interned columns are looked up by their raw bytes, so a repeated
+   # value is neither decoded nor stored again
+   def __projectrows__(self, csvreader, indexes, columns, recordtype, interncolumns):
+      interned = [{} if column in interncolumns else None for column in columns]
+      positions = range(len(indexes))
+      newrecord = tuple.__new__
+      for row in csvreader:
+         if row:
+            values = []
+            for position in positions:
+               value = row[indexes[position]]
+               table = interned[position]
+               if table is None:
+                  values.append(unicode(value, 'utf-8'))
+               else:
+                  decoded = table.get(value)
+                  if decoded is None:
+                     decoded = unicode(value, 'utf-8')
+                     if len(table) < INTERNLIMIT:
+                        table[value] = decoded
+                  values.append(decoded)
+            yield newrecord(recordtype, values)
+
+   # yields rows as tuples of only the columns asked for, in that order.
+   # Only those cells are decoded, the rest of the row is never touched
+   def csvprojectedgenerator(self, csvfname, columns, recordtype=tuple, interncolumns=()):
+      with opencsv(csvfname) as csvfile:
+         self.readingfile = csvfile
+         csvreader = csv.reader(csvfile)
+         header_list = [header.decode('utf-8') for header in csvreader.next()]
+         indexes = self.csvprojection(csvfname, header_list, columns)
+         for row in self.__projectrows__(csvreader, indexes, columns, recordtype, interncolumns):
+            yield row
+
+   # as csvprojectedgenerator, for the rows in a byte range from csvrowranges
+   def csvrangeprojectedgenerator(self, csvfname, header_list, columns, start, end, recordtype=tuple, interncolumns=()):
+      with opencsv(csvfname) as csvfile:
+         self.readingfile = csvfile
+         for row in self.csvlinesprojectedgenerator(csvfname, csvlinereader(csvfile, start, end), header_list, columns, recordtype, interncolumns):
+            yield row
+
+   # as csvprojectedgenerator, reading the file memory mapped, from start up
+   # to end if given, see MappedCSV
+   def csvmappedprojectedgenerator(self, csvfname, columns, start=None, end=None, recordtype=tuple, interncolumns=()):
+      header_list, headerend = self.csvheader(csvfname)
+      indexes = self.csvprojection(csvfname, header_list, columns)
+      mappedcsv = MappedCSV(csvfname)
+      self.readingfile = mappedcsv
+      try:
+         for row in self.__projectrows__(mappedcsv.rows(start, end), indexes, columns, recordtype, interncolumns):
+            yield row
+      finally:
+         mappedcsv.close()
+
+   # as csvrowranges, counting quotes a scan of the mapped file at a time
+   def csvmappedrowranges(self, csvfname, chunksize, start=None):
+      mappedcsv = MappedCSV(csvfname)
+      try:
+         return mappedcsv.rowranges(chunksize, start)
+      finally:
+         mappedcsv.close()
+
+   # data rows in the file, see MappedCSV.rowcount
+   def csvrowcount(self, csvfname):
+      mappedcsv = MappedCSV(csvfname)
+      try:
+         return mappedcsv.rowcount()
+      finally:
+         mappedcsv.close()
+
+   # as csvprojectedgenerator, for the rows in lines, e.g. from a csvlinereader
+   def csvlinesprojectedgenerator(self, csvfname, lines, header_list, columns, recordtype=tuple, interncolumns=()):
+      indexes = self.csvprojection(csvfname, header_list, columns)
+      for row in self.__projectrows__(csv.reader(lines), indexes, columns, recordtype, interncolumns):
+         yield row
 
 class droidCSVHandler():
 
-   #returns droidlist type
+   #name of the last container seen by filterrows, with includezips, or by
+   #filtercontainers
+   zipname = ''
+
+   #columns the filters need, a projection must always include these
+   FILTERCOLUMNS = ['TYPE', 'URI', 'NAME']
+
+   #classes of row counted by filterrows
+   FOLDER = 'folder'
+   FILE = 'file'
+   CONTAINER = 'container'
+   CONTAINERMEMBER = 'container member'
+
+   #rows are dicts keyed by column name, or given a list of columns, compact
+   #DROIDRecord tuples of just those columns. Either way the filters index
+   #rows with these keys
+   def __init__(self, columns=False):
+      self.columns = columns
+      if columns:
+         self.recordtype = droidrecordtype(columns)
+      self.TYPE = self.columnkey('TYPE')
+      self.URI = self.columnkey('URI')
+      self.NAME = self.columnkey('NAME')
+      self.counts = dict.fromkeys([self.FOLDER, self.FILE, self.CONTAINER, self.CONTAINERMEMBER], 0)
+      #reads the report, so can tell how far through it we are
+      self.csvhandler = genericCSVHandler()
+      #URI prefix: scheme, there are only ever a handful of these
+      self.schemes = {}
+
+   def columnkey(self, column):
+      if self.columns:
+         return self.columns.index(column)
+      return column
+
+   #returns droidlist type, a list of DROIDRecords if we have a projection
    def readDROIDCSV(self, droidcsvfname):
-      csvhandler = genericCSVHandler()
-      self.csv = csvhandler.csvaslist(droidcsvfname)
+      self.csv = list(self.__streamDROIDCSV__(droidcsvfname))
       return self.csv
 
+   #returns droid rows lazily, nothing is held in memory
+   def streamDROIDCSV(self, droidcsvfname):
+      csvhandler = genericCSVHandler()
+      return csvhandler.csvasgenerator(droidcsvfname)
+
+   #returns droid rows lazily as DROIDRecords of the handler's columns
+   def streamDROIDCSVprojected(self, droidcsvfname):
+      return self.csvhandler.csvprojectedgenerator(droidcsvfname, self.columns, self.recordtype, INTERNCOLUMNS)
+
+   #returns the rows in one byte range of the report, see csvrowranges
+   def streamDROIDCSVrange(self, droidcsvfname, header_list, start, end):
+      return self.csvhandler.csvrangeprojectedgenerator(droidcsvfname, header_list, self.columns, start, end, self.recordtype, INTERNCOLUMNS)
+
+   #returns the rows, or those in a byte range, reading the report memory mapped
+   def streamDROIDCSVmapped(self, droidcsvfname, start=None, end=None):
+      return self.csvhandler.csvmappedprojectedgenerator(droidcsvfname, self.columns, start, end, self.recordtype, INTERNCOLUMNS)
+
+   #returns the rows from a byte offset on a row boundary, or the first row,
+   #self.lines.pos is where the rows read so far end, see csvlinereader
+   def streamDROIDCSVfrom(self, droidcsvfname, start=None):
+      csvhandler = self.csvhandler
+      header_list, headerend = csvhandler.csvheader(droidcsvfname)
+      if start is None:
+         start = headerend
+      with opencsv(droidcsvfname) as csvfile:
+         csvhandler.readingfile = csvfile
+         self.lines = csvlinereader(csvfile, start)
+         for row in csvhandler.csvlinesprojectedgenerator(droidcsvfname, self.lines, header_list, self.columns, self.recordtype, INTERNCOLUMNS):
+            yield row
+
+   #bytes of the report read so far, see genericCSVHandler.bytesread
+   def bytesread(self):
+      return self.csvhandler.bytesread()
+
+   def __streamDROIDCSV__(self, droidcsvfname):
+      if self.columns:
+         return self.streamDROIDCSVprojected(droidcsvfname)
+      return self.streamDROIDCSV(droidcsvfname)
+
+   #single pass filter, each row is classified once as a folder, a file on
+   #disk, a container, or a member of a container, and every class counted.
+   #Folders are never kept. Files and containers on disk are kept, unless
+   #we include zips, then only container members are kept and the name of
+   #the container remembered
+   def filterrows(self, droidrows, includezips=False):
+      counts = self.counts
+      TYPE = self.TYPE
+      URI = self.URI
+      getURIScheme = self.getURIScheme
+      for row in droidrows:
+         rowtype = row[TYPE]
+         if rowtype == 'Folder':
+            counts[self.FOLDER]+=1
+         elif getURIScheme(row[URI]) == 'file':
+            if rowtype == 'Container':
+               counts[self.CONTAINER]+=1
+            else:
+               counts[self.FILE]+=1
+            if includezips:
+               self.zipname = row[self.NAME]
+            else:
+               yield row
+         else:
+            counts[self.CONTAINERMEMBER]+=1
+            if includezips:
+               yield row
+
+   #streaming filters, each takes and returns an iterable of droid rows
+   #so they can be chained without building intermediate lists. The
+   #generator uses filterrows, which does the lot in one pass
+   def filtercontainercontents(self, droidrows):
+      for row in droidrows:
+         if self.getURIScheme(row[self.URI]) == 'file':
+            yield row
+
+   def filterfolders(self, droidrows):
+      for row in droidrows:
+         if row[self.TYPE] != 'Folder':
+            yield row
+
+   #keeps container contents only, remembering the container name
+   def filtercontainers(self, droidrows):
+      for row in droidrows:
+         if self.getURIScheme(row[self.URI]) != 'file':
+            yield row
+         else:
+            self.zipname = row[self.NAME]
+
+   #a single pass over the report to find the container name up front
+   #needed when the IE title is the zip name and is output with the first row
+   def findzipname(self, droidcsvfname):
+      #own handler so the pre-pass isn't added to this handler's counts
+      prepass = droidCSVHandler(self.columns)
+      for row in prepass.filterrows(prepass.__streamDROIDCSV__(droidcsvfname), True):
+         pass
+      self.zipname = prepass.zipname
+      return self.zipname
+
    def removecontainercontents(self, droidlist):
-      newlist = []   # naive remove causes loop to skip items
-      for row in droidlist:
-         uris = self.getURIScheme(row['URI'])
-         if self.getURIScheme(row['URI']) == 'file':
-            newlist.append(row)
-      return newlist
-   
+      return list(self.filtercontainercontents(droidlist))
+
    def removefolders(self, droidlist):
-      #TODO: We can generate counts here and store in member vars
-      newlist = []   # naive remove causes loop to skip items
-      for i,row in enumerate(droidlist):
-         if row['TYPE'] != 'Folder':
-            newlist.append(row)      
-      return newlist
- 
+      return list(self.filterfolders(droidlist))
+
    def retrievefolderlist(self, droidlist):
       newlist = []
       for row in droidlist:
-         if row['TYPE'] == 'Folder':
-            newlist.append(row['FILE_PATH'])
+         if row[self.TYPE] == 'Folder':
+            newlist.append(row[self.columnkey('FILE_PATH')])
             
       return newlist
       
+   #cached on the text before the first colon, the scheme urlparse finds
+   #for one URI is the scheme for every other URI with that prefix
    def getURIScheme(self, url):
-      return urlparse(url).scheme
+      prefix = url.partition(':')[0]
+      scheme = self.schemes.get(prefix)
+      if scheme is None:
+         scheme = urlparse(url).scheme
+         if scheme:
+            self.schemes[prefix] = scheme
+      return scheme
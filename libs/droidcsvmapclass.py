@@ -0,0 +1,122 @@
+import csv
+import sys
+import mmap
+from compressedcsvclass import compression
+
+#A CSV file memory mapped and read a line at a time straight from the
+#mapping, without a Python file object. DROID quotes every value, so a line
+#with just the quotes around its values is split on '","' as it is. Lines
+#with any other quotes, escaped quotes or a newline inside a value, are
+#left to the csv module
+class MappedCSV:
+
+   #bytes counted at a time when looking for row boundaries
+   SCANSIZE = 4 * 1024 * 1024
+
+   def __init__(self, csvfname):
+      self.csvfname = csvfname
+      if compression(csvfname):
+         sys.exit("ERROR: A compressed DROID report can't be memory mapped, " + csvfname + ".")
+      self.csvfile = open(csvfname, 'rb')
+      try:
+         self.mapped = mmap.mmap(self.csvfile.fileno(), 0, access=mmap.ACCESS_READ)
+      except ValueError:
+         #an empty file can't be mapped, there's nothing to read anyway
+         self.mapped = None
+      self.size = self.mapped.size() if self.mapped is not None else 0
+      headerline = self.mapped.readline() if self.mapped is not None else ''
+      self.headerend = len(headerline)
+      #quotes on a line with every value quoted and nothing else quoted
+      self.quotes = headerline.count('"')
+      self.columns = self.quotes // 2
+
+   def close(self):
+      if self.mapped is not None:
+         self.mapped.close()
+         self.mapped = None
+      self.csvfile.close()
+
+   #rows as lists of values, from the row starting at start, or the first
+   #after the header, up to end. self.pos is where the rows read so far end
+   def rows(self, start=None, end=None):
+      if self.mapped is None:
+         return
+      mapped = self.mapped
+      mapped.seek(self.headerend if start is None else start)
+      if end is None:
+         end = self.size
+      readline = mapped.readline
+      tell = mapped.tell
+      quotes = self.quotes
+      columns = self.columns
+      while tell() < end:
+         line = readline()
+         row = None
+         if line.count('"') == quotes:
+            if line.endswith('"\n'):
+               row = line[1:-2].split('","')
+            elif line.endswith('"\r\n'):
+               row = line[1:-3].split('","')
+            if row is not None and len(row) != columns:
+               row = None
+         if row is None:
+            lines = [line]
+            #a newline inside a value leaves an odd number of quotes
+            while sum([part.count('"') for part in lines]) % 2 and tell() < self.size:
+               lines.append(readline())
+            row = next(csv.reader(lines), [])
+         self.pos = tell()
+         if row:
+            yield row
+
+   #quote parity is counted a scan at a time, only the lines either side of
+   #a boundary are looked at one by one
+   def __rowend__(self, start, pos):
+      mapped = self.mapped
+      inquotes = mapped[start:pos].count('"') % 2 == 1
+      while pos < self.size:
+         newline = mapped.find('\n', pos)
+         if newline == -1:
+            return self.size
+         inquotes = inquotes != (mapped[pos:newline].count('"') % 2 == 1)
+         pos = newline + 1
+         if not inquotes:
+            return pos
+      return self.size
+
+   #byte ranges of roughly chunksize starting and ending on row boundaries,
+   #as genericCSVHandler.csvrowranges, from start or the first data row
+   def rowranges(self, chunksize, start=None):
+      if start is None:
+         start = self.headerend
+      ranges = []
+      while start < self.size:
+         end = self.size
+         if start + chunksize < self.size:
+            end = self.__rowend__(start, start + chunksize - 1)
+         ranges.append((start, end))
+         start = end
+      return ranges
+
+   #data rows, counted a scan at a time by their line ends. Only if there
+   #are line ends that don't follow a quote, e.g. a newline inside a value,
+   #are the rows read and counted one by one
+   def rowcount(self):
+      newlines = 0
+      rowends = 0
+      pos = self.headerend
+      while pos < self.size:
+         #scans end on a line end, so none is split between two
+         end = self.mapped.find('\n', pos + self.SCANSIZE)
+         end = self.size if end == -1 else end + 1
+         scan = self.mapped[pos:end]
+         newlines += scan.count('\n')
+         rowends += scan.count('"\n') + scan.count('"\r\n')
+         pos = end
+      #the last row needn't have a line end
+      if self.size > self.headerend and self.mapped[self.size - 1] != '\n':
+         newlines+=1
+         rowends+=1
+      if newlines == rowends:
+         return newlines
+      return sum([1 for row in self.rows()])
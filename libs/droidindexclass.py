@@ -0,0 +1,190 @@
+import os
+import sys
+import array
+import heapq
+import bisect
+import shutil
+import tempfile
+from atomicfileclass import replacefile
+from droidcsvhandlerclass import genericCSVHandler
+from rosettacsvvalidatorclass import digest64
+
+#what makes a file the same file from one report to the next: its path,
+#size and hash, or size and last modified date if the report has no hash.
+#Unsigned, so keys sort the same as their high and low halves
+def filekey(path, size, lastmodified, hashvalue):
+   return digest64((path + u'\0' + size + u'\0' + (hashvalue or lastmodified)).encode('utf-8')) & 0xFFFFFFFFFFFFFFFF
+
+#the index of a previous DROID report, previous may be the report itself,
+#indexed into a temporary file, or an index already built from it
+def droidindex(previous):
+   with open(previous, 'rb') as f:
+      magic = f.read(len(DROIDIndex.MAGIC))
+   if magic == DROIDIndex.MAGIC:
+      return DROIDIndex(previous).open()
+   fd, indexfile = tempfile.mkstemp(suffix='.droidindex')
+   os.close(fd)
+   index = DROIDIndex(indexfile, True)
+   index.build(previous)
+   return index.open()
+
+#The files in a DROID report, kept as a sorted file of 64 bit digests of
+#each file's path and fingerprint, see filekey. A file is unchanged if its
+#digest is in the index, new or changed if not, so a lookup is a binary
+#search of 8 bytes a file, a report of millions of rows indexes in tens of
+#MB. Python 2 arrays have no 64 bit type that is 64 bits everywhere, so
+#the high and low halves of the keys are kept in arrays of their own. The
+#index is built as RosettaCSVGrouper sorts, a run of keys at a time sorted
+#in memory and written to a temporary file, then the runs merged, so
+#building it takes no more memory than a run however large the report
+class DROIDIndex:
+
+   #DROID names the hash column for the algorithm it was asked to use
+   HASHCOLUMNS = ['MD5_HASH', 'SHA1_HASH', 'SHA256_HASH']
+
+   MAGIC = 'DROIDINDEX1\n'
+
+   #keys sorted in memory at a time while building
+   RUNSIZE = 100000
+
+   #keys read from a run, or written to the index, at a time
+   CHUNKSIZE = 8192
+
+   def __init__(self, indexfile, temporary=False):
+      self.indexfile = indexfile
+      self.temporary = temporary
+      self.highs = None
+      self.lows = None
+
+   #the columns a file key is made from, in the order filekey takes them
+   def columns(self, droidcsv):
+      header_list, start = genericCSVHandler().csvheader(droidcsv)
+      columns = ['FILE_PATH', 'SIZE', 'LAST_MODIFIED']
+      for column in self.HASHCOLUMNS:
+         if column in header_list:
+            columns.append(column)
+            break
+      return columns
+
+   #keys are kept little endian on disk
+   def __swap__(self, halves):
+      if sys.byteorder == 'big':
+         halves.byteswap()
+
+   #a run is only read back by this process, so is kept in native order,
+   #a high half then a low half for each key
+   def __writerun__(self, run):
+      halves = array.array('I')
+      for key in sorted(set(run)):
+         halves.append(key >> 32)
+         halves.append(key & 0xFFFFFFFF)
+      runfile = tempfile.TemporaryFile()
+      halves.tofile(runfile)
+      runfile.seek(0)
+      return runfile
+
+   def __readrun__(self, runfile):
+      while True:
+         halves = array.array('I')
+         try:
+            halves.fromfile(runfile, 2 * self.CHUNKSIZE)
+         except EOFError:
+            #what was left is read all the same
+            pass
+         if not halves:
+            break
+         for position in xrange(0, len(halves), 2):
+            yield (halves[position] << 32) | halves[position + 1]
+      runfile.close()
+
+   def __writehalves__(self, halves, outfile):
+      self.__swap__(halves)
+      halves.tofile(outfile)
+
+   #written to a temporary file then renamed, so a half built index is never used
+   def build(self, droidcsv):
+      droidrows = genericCSVHandler().csvprojectedgenerator(droidcsv, ['TYPE'] + self.columns(droidcsv))
+      #folders aren't kept
+      run = []
+      runfiles = []
+      for row in droidrows:
+         if row[0] != 'Folder':
+            run.append(filekey(row[1], row[2], row[3], row[4] if len(row) > 4 else None))
+            if len(run) >= self.RUNSIZE:
+               runfiles.append(self.__writerun__(run))
+               run = []
+      keys = sorted(set(run))
+      if runfiles:
+         keys = heapq.merge(iter(keys), *[self.__readrun__(runfile) for runfile in runfiles])
+      tmpname = self.indexfile + '.tmp'
+      #the high halves go straight to the index, the low halves follow them
+      #so are kept to one side until the last key
+      with open(tmpname, 'wb') as indexfile:
+         lowsfile = tempfile.TemporaryFile()
+         try:
+            indexfile.write(self.MAGIC)
+            highs = array.array('I')
+            lows = array.array('I')
+            previous = None
+            for key in keys:
+               #a file listed twice is only kept once
+               if key == previous:
+                  continue
+               previous = key
+               highs.append(key >> 32)
+               lows.append(key & 0xFFFFFFFF)
+               if len(highs) >= self.CHUNKSIZE:
+                  self.__writehalves__(highs, indexfile)
+                  self.__writehalves__(lows, lowsfile)
+                  highs = array.array('I')
+                  lows = array.array('I')
+            self.__writehalves__(highs, indexfile)
+            self.__writehalves__(lows, lowsfile)
+            lowsfile.seek(0)
+            shutil.copyfileobj(lowsfile, indexfile)
+         finally:
+            lowsfile.close()
+      replacefile(tmpname, self.indexfile)
+
+   def open(self):
+      with open(self.indexfile, 'rb') as indexfile:
+         if indexfile.read(len(self.MAGIC)) != self.MAGIC:
+            sys.exit("ERROR: " + self.indexfile + " isn't a DROID report index.")
+         self.highs = array.array('I')
+         self.lows = array.array('I')
+         keycount = (os.path.getsize(self.indexfile) - len(self.MAGIC)) // (2 * self.highs.itemsize)
+         for halves in [self.highs, self.lows]:
+            halves.fromfile(indexfile, keycount)
+            self.__swap__(halves)
+      return self
+
+   #a temporary index is only any use while it's open
+   def close(self):
+      self.highs = self.lows = None
+      if self.temporary and os.path.exists(self.indexfile):
+         os.remove(self.indexfile)
+
+   #yields only the rows for files new or changed since the indexed report,
+   #rows left out are counted as unchanged. droidcolumns are the columns of
+   #the rows, they must include keycolumns, see columns
+   def changedrows(self, droidrows, droidcolumns, keycolumns, counts):
+      highs = self.highs
+      lows = self.lows
+      keycount = len(highs)
+      bisect_left = bisect.bisect_left
+      indexes = [droidcolumns.index(column) for column in keycolumns]
+      path, size, lastmodified = indexes[:3]
+      hashvalue = indexes[3] if len(indexes) > 3 else None
+      counts.setdefault('unchanged', 0)
+      for row in droidrows:
+         key = filekey(row[path], row[size], row[lastmodified], row[hashvalue] if hashvalue is not None else None)
+         #keys sharing a high half are few, they are next to each other
+         high = key >> 32
+         low = key & 0xFFFFFFFF
+         position = bisect_left(highs, high)
+         while position < keycount and highs[position] == high and lows[position] != low:
+            position+=1
+         if position < keycount and highs[position] == high:
+            counts['unchanged']+=1
+            continue
+         yield row
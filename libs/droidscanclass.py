@@ -0,0 +1,192 @@
+import os
+import sys
+import stat
+import time
+import codecs
+import urllib
+from multiprocessing.pool import ThreadPool
+try:
+   from os import scandir
+except ImportError:
+   try:
+      from scandir import scandir
+   except ImportError:
+      #no scandir on Python 2 without the scandir module, directories are
+      #listed and each entry stat'ed instead
+      scandir = None
+
+#Windows lists unicode names as they are, elsewhere names are bytes, decoded
+#for the rows. Python 2 takes an unset locale to mean ASCII, UTF-8 is far
+#more likely
+FSENCODING = sys.getfilesystemencoding() or 'utf-8'
+if codecs.lookup(FSENCODING).name == 'ascii':
+   FSENCODING = 'utf-8'
+
+def fsdecode(path):
+   if isinstance(path, unicode):
+      return path
+   return path.decode(FSENCODING, 'replace')
+
+#a path from a DROID report as the filesystem takes it, Python 2 would
+#encode it as ASCII under a C locale, e.g. from cron
+def fsencode(path):
+   if os.name == 'nt' or not isinstance(path, unicode):
+      return path
+   return path.encode(FSENCODING)
+
+#a path as DROID gives it in the URI column, e.g. file:/data/acc/d0/ or
+#file:/C:/acc/d0/, folders end with a slash
+def fileuri(path, folder=False):
+   url = urllib.pathname2url(path.encode('utf-8'))
+   uri = u'file:/' + unicode(url.lstrip('/'), 'ascii')
+   if folder and not uri.endswith(u'/'):
+      uri += u'/'
+   return uri
+
+#DROID's own format, in local time
+def lastmodified(mtime):
+   return unicode(time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(mtime)))
+
+#Lists a directory tree as the rows of a DROID report would list it, a
+#Folder row followed by its files then its folders, with the columns the
+#mappings use, ID, PARENT_ID, URI, FILE_PATH, NAME, STATUS, SIZE, TYPE, EXT
+#and LAST_MODIFIED. Nothing is identified, other columns are left empty, so
+#there are no containers. Directories are listed on a pool of threads, those
+#next in line listed ahead of time, so subtrees are read in parallel while
+#rows still come out in order
+class DROIDScan:
+
+   THREADS = 8
+
+   #directories listed ahead of the one being read, per thread
+   READAHEAD = 4
+
+   #DROID's status for a folder that was or wasn't read
+   DONE = u'Done'
+   ACCESSDENIED = u'Access denied'
+
+   def __init__(self, directory, threads=THREADS):
+      if not os.path.isdir(directory):
+         sys.exit("ERROR: " + directory + " isn't a directory to scan.")
+      if os.name == 'nt':
+         directory = fsdecode(directory)
+      elif isinstance(directory, unicode):
+         directory = directory.encode(FSENCODING)
+      self.directory = os.path.abspath(directory)
+      self.threads = threads
+
+   #(name, is a folder, stat) for each entry, a link to a file is stat'ed for
+   #the file. Links to folders are left out, they aren't followed, so a tree
+   #can't loop, and aren't files
+   def __entries__(self, path):
+      if scandir is not None:
+         for entry in scandir(path):
+            isdir = entry.is_dir(follow_symlinks=False)
+            try:
+               if entry.is_symlink() and entry.is_dir():
+                  continue
+               yield entry.name, isdir, entry.stat()
+            except OSError:
+               continue
+      else:
+         #one lstat an entry, only a link needs another
+         join = os.path.join
+         lstat = os.lstat
+         S_ISDIR = stat.S_ISDIR
+         S_ISLNK = stat.S_ISLNK
+         for name in os.listdir(path):
+            fullpath = join(path, name)
+            try:
+               st = lstat(fullpath)
+               if S_ISLNK(st.st_mode):
+                  st = os.stat(fullpath)
+                  if not S_ISDIR(st.st_mode):
+                     yield name, False, st
+               else:
+                  yield name, S_ISDIR(st.st_mode), st
+            except OSError:
+               continue
+
+   #run on the pool. Returns the folder's status, and its entries, sorted,
+   #as (name, is a folder, size, modification time). Links to folders and
+   #broken links are left out
+   def listdir(self, path):
+      try:
+         entries = [(name, isdir, st.st_size, st.st_mtime) for name, isdir, st in self.__entries__(path)]
+      except OSError:
+         return self.ACCESSDENIED, []
+      entries.sort()
+      return self.DONE, entries
+
+   #rows of the columns asked for, as recordtype, see droidCSVHandler.
+   #Values are set by position on a copy of an empty row, a column that
+   #isn't asked for is never worked out
+   def rows(self, columns, recordtype=tuple):
+      positions = dict([(column, i) for i, column in enumerate(columns)])
+      ID, PARENT_ID, URI, FILE_PATH, NAME, STATUS, SIZE, TYPE, EXT, LAST_MODIFIED = [positions.get(column) for column in
+         ['ID', 'PARENT_ID', 'URI', 'FILE_PATH', 'NAME', 'STATUS', 'SIZE', 'TYPE', 'EXT', 'LAST_MODIFIED']]
+      empty = [u''] * len(columns)
+      newrecord = tuple.__new__
+      quote = urllib.quote
+      splitext = os.path.splitext
+      join = os.path.join
+      readahead = self.threads * self.READAHEAD
+      pending = {}
+      lastid = 0
+      #folders still to read, the next one last, with their parent's ID
+      #and modification time
+      stack = [(self.directory, u'', os.stat(self.directory).st_mtime)]
+      pool = ThreadPool(self.threads)
+      try:
+         while stack:
+            for path, parentid, mtime in stack[-readahead:]:
+               if path not in pending:
+                  pending[path] = pool.apply_async(self.listdir, (path,))
+            path, parentid, mtime = stack.pop()
+            status, entries = pending.pop(path).get()
+            lastid+=1
+            folderid = unicode(lastid)
+            folderpath = fsdecode(path)
+            folderuri = fileuri(folderpath, True)
+            row = empty[:]
+            for position, value in [(ID, folderid), (PARENT_ID, parentid), (URI, folderuri), (FILE_PATH, folderpath),
+                                    (NAME, os.path.basename(folderpath) or folderpath), (STATUS, status), (TYPE, u'Folder'),
+                                    (LAST_MODIFIED, lastmodified(mtime))]:
+               if position is not None:
+                  row[position] = value
+            yield newrecord(recordtype, row)
+            folders = []
+            for name, isdir, size, mtime in entries:
+               if isdir:
+                  folders.append((join(path, name), folderid, mtime))
+                  continue
+               lastid+=1
+               name = fsdecode(name)
+               row = empty[:]
+               if ID is not None:
+                  row[ID] = unicode(lastid)
+               if PARENT_ID is not None:
+                  row[PARENT_ID] = folderid
+               if URI is not None:
+                  #a file's URI is its folder's with its name on the end
+                  row[URI] = folderuri + unicode(quote(name.encode('utf-8')))
+               if FILE_PATH is not None:
+                  row[FILE_PATH] = join(folderpath, name)
+               if NAME is not None:
+                  row[NAME] = name
+               if STATUS is not None:
+                  row[STATUS] = self.DONE
+               if SIZE is not None:
+                  row[SIZE] = unicode(size)
+               if TYPE is not None:
+                  row[TYPE] = u'File'
+               if EXT is not None:
+                  row[EXT] = splitext(name)[1][1:]
+               if LAST_MODIFIED is not None:
+                  row[LAST_MODIFIED] = lastmodified(mtime)
+               yield newrecord(recordtype, row)
+            stack.extend(reversed(folders))
+      finally:
+         #folders still being listed, if we stopped early, aren't waited for
+         pool.terminate()
+         pool.join()
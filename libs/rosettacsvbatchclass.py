@@ -0,0 +1,97 @@
+import os
+import sys
+import glob
+import json
+import time
+import multiprocessing
+from compressedcsvclass import uncompressedname
+
+#each worker process parses the config and schema, and compiles the
+#mapping plan, once for every report in the batch
+batchgenerator = None
+
+def initbatchworker(rosettaschema, configfile, cachedir=False):
+   global batchgenerator
+   #import here, the generator isn't needed until a worker starts
+   from RosettaCSVGenerator import RosettaCSVGenerator
+   batchgenerator = RosettaCSVGenerator(False, rosettaschema, configfile, cachedir=cachedir)
+
+def generatereport(report):
+   droidcsv, outfile = report
+   csvgen = batchgenerator.forreport(droidcsv, outfile)
+   error = ''
+   start = time.time()
+   try:
+      csvgen.export2rosettacsv()
+   except SystemExit as e:
+      #e.g. an empty listing, shouldn't stop the rest of the batch
+      error = str(e.code)
+   except Exception as e:
+      error = e.__class__.__name__ + ': ' + str(e)
+   return { 'droidcsv': droidcsv, 'rosettacsv': outfile, 'items': csvgen.itemcount,
+            'rows': csvgen.rowcount, 'filtercounts': csvgen.filtercounts,
+            'pathcachestats': csvgen.pathcachestats, 'seconds': round(time.time() - start, 3), 'error': error }
+
+#Generates one Rosetta CSV per DROID report for a directory, glob or
+#manifest of reports, sharing one parsed config and schema
+class RosettaCSVBatch:
+
+   def __init__(self, rosettaschema, configfile, outdir, workers=1, cachedir=False):
+      self.rosettaschema = rosettaschema
+      self.configfile = configfile
+      self.outdir = outdir
+      self.workers = workers
+      self.cachedir = cachedir
+
+   #a directory of DROID CSVs, a glob pattern, or a manifest file
+   #listing one DROID CSV per line
+   def listreports(self, source):
+      if os.path.isdir(source):
+         reports = sorted(sum([glob.glob(os.path.join(source, pattern)) for pattern in ['*.csv', '*.csv.gz', '*.csv.bz2', '*.csv.xz']], []))
+      elif os.path.isfile(source) and not uncompressedname(source).lower().endswith('.csv'):
+         reports = []
+         with open(source, 'rb') as manifest:
+            for line in manifest:
+               line = line.strip()
+               if line and not line.startswith('#'):
+                  reports.append(line)
+      else:
+         reports = sorted(glob.glob(source))
+      if len(reports) == 0:
+         sys.exit("ERROR: No DROID reports found in " + source)
+      return reports
+
+   def outputname(self, droidcsv):
+      return os.path.join(self.outdir, os.path.splitext(os.path.basename(uncompressedname(droidcsv)))[0] + '-rosetta.csv')
+
+   def run(self, source):
+      reports = [(droidcsv, self.outputname(droidcsv)) for droidcsv in self.listreports(source)]
+      outfiles = [outfile for droidcsv, outfile in reports]
+      if len(set(outfiles)) != len(outfiles):
+         sys.exit("ERROR: DROID reports with the same file name would overwrite each other's Rosetta CSV.")
+      if not os.path.isdir(self.outdir):
+         os.makedirs(self.outdir)
+
+      if self.workers > 1:
+         pool = multiprocessing.Pool(self.workers, initbatchworker, (self.rosettaschema, self.configfile, self.cachedir))
+         try:
+            results = pool.map(generatereport, reports, 1)
+         finally:
+            pool.close()
+            pool.join()
+      else:
+         initbatchworker(self.rosettaschema, self.configfile, self.cachedir)
+         results = [generatereport(report) for report in reports]
+      return results
+
+   def writesummary(self, results, summaryfile=False):
+      for result in results:
+         status = result['error'] if result['error'] else 'OK'
+         hitrate = result['pathcachestats'].get('hitrate', 0.0) * 100
+         sys.stderr.write("%s: %d items, %d rows, %.3fs, path cache %.1f%% hits, %s\n" % (result['droidcsv'], result['items'], result['rows'],
+                          result['seconds'], hitrate, status))
+      sys.stderr.write("%d reports, %d failed, %d rows, %.3fs\n" % (len(results), len([r for r in results if r['error']]),
+                       sum([r['rows'] for r in results]), sum([r['seconds'] for r in results])))
+      if summaryfile:
+         with open(summaryfile, 'wb') as summary:
+            json.dump(results, summary, indent=2)
@@ -0,0 +1,57 @@
+import os
+import hashlib
+import cPickle
+import tempfile
+from atomicfileclass import replacefile
+
+#SHA-1 of the content of each file, in order, e.g. to tell if a config or
+#schema has changed since it was last used
+def filesdigest(fnames, salt=''):
+   digest = hashlib.sha1(salt)
+   for fname in fnames:
+      with open(fname, 'rb') as f:
+         digest.update(hashlib.sha1(f.read()).digest())
+   return digest.hexdigest()
+
+#Keeps the compiled config, schema and mapping plan on disk, keyed by a
+#hash of the content of the config and schema files, so an unchanged pair
+#is loaded rather than parsed and compiled again. A changed file has a new
+#key, so a stale entry is never used, just left behind
+class RosettaCSVCache:
+
+   #bump when what is compiled changes shape, so old entries aren't loaded
+   CACHEVERSION = '3'
+
+   def __init__(self, cachedir):
+      self.cachedir = cachedir
+
+   def cachekey(self, configfile, rosettaschema):
+      return filesdigest([configfile, rosettaschema], self.CACHEVERSION)
+
+   def cachefile(self, configfile, rosettaschema):
+      return os.path.join(self.cachedir, self.cachekey(configfile, rosettaschema) + '.pickle')
+
+   #returns the compiled dict, or None if there's no usable entry
+   def load(self, configfile, rosettaschema):
+      try:
+         with open(self.cachefile(configfile, rosettaschema), 'rb') as cached:
+            return cPickle.load(cached)
+      except (IOError, EOFError, cPickle.UnpicklingError, AttributeError, ImportError):
+         #missing, or left half written, compile again
+         return None
+
+   #written to a temporary file then renamed, so a reader never sees part
+   #of an entry. Failing to cache isn't a reason to fail the run
+   def save(self, configfile, rosettaschema, compiled):
+      tmpname = None
+      try:
+         if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+         cachefile = self.cachefile(configfile, rosettaschema)
+         fd, tmpname = tempfile.mkstemp(dir=self.cachedir, suffix='.tmp')
+         with os.fdopen(fd, 'wb') as cached:
+            cPickle.dump(compiled, cached, cPickle.HIGHEST_PROTOCOL)
+         replacefile(tmpname, cachefile)
+      except (IOError, OSError):
+         if tmpname and os.path.exists(tmpname):
+            os.remove(tmpname)
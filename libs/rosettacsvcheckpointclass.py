@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+from atomicfileclass import replacefile
+from rosettacsvcacheclass import filesdigest
+
+#Records how far through the DROID report and the Rosetta CSV a run has got
+#in a file next to the sheet, so an interrupted run can carry on from the
+#last checkpoint instead of starting again. Offsets are of row boundaries:
+#where the next DROID row starts and where the sheet ends once flushed
+class RosettaCSVCheckpoint:
+
+   #DROID items written between checkpoints
+   CHECKPOINTITEMS = 10000
+
+   def __init__(self, outfile, droidcsv, rosettaschema, configfile):
+      self.checkpointfile = outfile + '.checkpoint'
+      self.outfile = outfile
+      self.droidcsv = droidcsv
+      self.rosettaschema = rosettaschema
+      self.configfile = configfile
+
+   #what the sheet was generated from, a checkpoint is only any use if
+   #none of it has changed since
+   def inputs(self):
+      droidstat = os.stat(self.droidcsv)
+      return { 'droidcsv': os.path.abspath(self.droidcsv), 'droidsize': droidstat.st_size, 'droidmtime': droidstat.st_mtime,
+               'configdigest': filesdigest([self.configfile, self.rosettaschema]) }
+
+   #returns the state saved by the last checkpoint
+   def load(self):
+      try:
+         with open(self.checkpointfile, 'rb') as checkpoint:
+            saved = json.load(checkpoint)
+      except IOError:
+         sys.exit("ERROR: No checkpoint to resume from, " + self.checkpointfile + " not found. Run again without --resume.")
+      except ValueError:
+         sys.exit("ERROR: Checkpoint " + self.checkpointfile + " can't be read.")
+      #compared as they come back from JSON, e.g. the path as unicode
+      if saved['inputs'] != json.loads(json.dumps(self.inputs())):
+         sys.exit("ERROR: DROID report, config or schema changed since checkpoint " + self.checkpointfile + " was taken.")
+      if not os.path.exists(self.outfile) or os.path.getsize(self.outfile) < saved['state']['outputoffset']:
+         sys.exit("ERROR: Rosetta CSV " + self.outfile + " is shorter than when checkpoint " + self.checkpointfile + " was taken.")
+      state = saved['state']
+      state['filtercounts'] = dict([(str(rowclass), count) for rowclass, count in state['filtercounts'].items()])
+      return state
+
+   #state is what the generator needs to carry on: inputoffset, outputoffset,
+   #itemcount, rowcount, zipname and filtercounts. Written to a temporary
+   #file then renamed, so a checkpoint is never seen half written
+   def save(self, state):
+      tmpname = self.checkpointfile + '.tmp'
+      with open(tmpname, 'wb') as checkpoint:
+         json.dump({ 'inputs': self.inputs(), 'state': state }, checkpoint)
+         checkpoint.flush()
+         os.fsync(checkpoint.fileno())
+      replacefile(tmpname, self.checkpointfile)
+
+   #the sheet is complete, there is nothing left to resume
+   def remove(self):
+      if os.path.exists(self.checkpointfile):
+         os.remove(self.checkpointfile)
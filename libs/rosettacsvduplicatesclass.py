@@ -0,0 +1,152 @@
+import sys
+import array
+import unicodecsv
+
+#what a row found to be a copy of an earlier one is annotated with, the
+#DROID ID of the first copy, or empty. Not read from the DROID report, the
+#duplicates stage adds it to the end of each row
+DUPLICATECOLUMN = 'DUPLICATE_OF'
+
+#Finds files that are byte-identical copies of a file earlier in the report,
+#with the same hash and size. Rows are passed through with duplicates
+#skipped, or reported, or annotated with the ID of the first copy, see
+#MODES. The index of files seen is an open addressing hash table kept in
+#arrays, 12 bytes a slot, a 64 bit key of the hash and size and the number
+#of the first copy, rather than a dict of a hundred or so bytes an entry.
+#The key only places a file in the table and rules out most files that
+#aren't copies, a file is only a copy once its whole hash and its size
+#match those of the first copy, kept in lists with its ID, the hash as a
+#byte string, a quarter the size of a unicode one. As for DROIDIndex,
+#Python 2 arrays have no 64 bit type that is 64 bits everywhere, so the high
+#and low halves of the keys are kept in arrays of their own. A hash is
+#already random, so its own bits place a key in the table
+class RosettaCSVDuplicates:
+
+   SKIP = 'skip'
+   REPORT = 'report'
+   ANNOTATE = 'annotate'
+   MODES = [SKIP, REPORT, ANNOTATE]
+
+   #slots in a new table, a power of two
+   TABLESIZE = 1 << 16
+
+   def __init__(self, hashcolumn, mode=SKIP, reportfile=False, tablesize=TABLESIZE):
+      self.hashcolumn = hashcolumn
+      self.mode = mode
+      self.reportfile = reportfile
+      self.counts = { 'indexed': 0, 'duplicates': 0, 'duplicatebytes': 0, 'unhashed': 0, 'indexmb': 0.0 }
+      #hash, size and ID of each file indexed, by its number
+      self.hashes = []
+      self.sizes = []
+      self.ids = []
+      self.__newtable__(tablesize)
+
+   def __newtable__(self, tablesize):
+      self.mask = tablesize - 1
+      self.highs = array.array('I', [0]) * tablesize
+      self.lows = array.array('I', [0]) * tablesize
+      #number of the first copy plus one, nought for an empty slot
+      self.firsts = array.array('I', [0]) * tablesize
+
+   #the table is doubled once two thirds full, so a lookup for a file not
+   #yet seen, most lookups, probes a few slots at most
+   def __grow__(self):
+      oldhighs, oldlows, oldfirsts = self.highs, self.lows, self.firsts
+      self.__newtable__(len(oldfirsts) * 2)
+      mask, highs, lows, firsts = self.mask, self.highs, self.lows, self.firsts
+      for oldslot, first in enumerate(oldfirsts):
+         if first:
+            low = oldlows[oldslot]
+            slot = low & mask
+            while firsts[slot]:
+               slot = (slot + 1) & mask
+            highs[slot] = oldhighs[oldslot]
+            lows[slot] = low
+            firsts[slot] = first
+
+   #the columns rows need for duplicates to be found and reported
+   def columns(self):
+      return ['ID', 'URI', 'SIZE', self.hashcolumn]
+
+   #the columns rows have after the duplicates stage, droidcolumns are the
+   #columns they're read with
+   def rowcolumns(self, droidcolumns):
+      if self.mode == self.ANNOTATE:
+         return droidcolumns + [DUPLICATECOLUMN]
+      return droidcolumns
+
+   def __openreport__(self):
+      if not self.reportfile:
+         return None, None
+      report = open(self.reportfile, 'wb')
+      reportwriter = unicodecsv.writer(report, encoding='utf-8')
+      reportwriter.writerow([u'ID', DUPLICATECOLUMN, self.hashcolumn.decode('ascii'), u'SIZE', u'URI'])
+      return report, reportwriter
+
+   #yields the rows with duplicates skipped, or annotated, as mode says.
+   #Duplicates are written to the report file, if there is one, whatever
+   #the mode. droidcolumns are the columns of the rows, recordtype the type
+   #of rows to annotate, see droidrecordtype
+   def duplicaterows(self, droidrows, droidcolumns, recordtype=tuple):
+      ID, URI, SIZE, HASH = [droidcolumns.index(column) for column in self.columns()]
+      skip = self.mode == self.SKIP
+      annotate = self.mode == self.ANNOTATE
+      newrecord = tuple.__new__
+      nocopy = (u'',)
+      counts = self.counts
+      mask, highs, lows, firsts = self.mask, self.highs, self.lows, self.firsts
+      hashes, sizes, ids = self.hashes, self.sizes, self.ids
+      report, reportwriter = self.__openreport__()
+      try:
+         for row in droidrows:
+            hashvalue = row[HASH]
+            try:
+               size = int(row[SIZE] or 0)
+               #64 bits of the hash, a half at a time so neither is a long,
+               #with the size mixed in
+               high = int(hashvalue[:8], 16) ^ ((size >> 32) & 0xFFFFFFFF)
+               low = int(hashvalue[8:16], 16) ^ (size & 0xFFFFFFFF)
+            except ValueError:
+               counts['unhashed']+=1
+               if annotate:
+                  row = newrecord(recordtype, row + nocopy)
+               yield row
+               continue
+            slot = low & mask
+            first = firsts[slot]
+            hashbytes = hashvalue.encode('utf-8')
+            while first and (lows[slot] != low or highs[slot] != high or hashes[first - 1] != hashbytes or sizes[first - 1] != size):
+               slot = (slot + 1) & mask
+               first = firsts[slot]
+            if not first:
+               hashes.append(hashbytes)
+               sizes.append(size)
+               ids.append(row[ID])
+               highs[slot] = high
+               lows[slot] = low
+               firsts[slot] = len(ids)
+               counts['indexed']+=1
+               if counts['indexed'] * 3 >= len(firsts) * 2:
+                  self.__grow__()
+                  mask, highs, lows, firsts = self.mask, self.highs, self.lows, self.firsts
+               if annotate:
+                  row = newrecord(recordtype, row + nocopy)
+               yield row
+               continue
+            counts['duplicates']+=1
+            counts['duplicatebytes']+=size
+            original = ids[first - 1]
+            if reportwriter is not None:
+               reportwriter.writerow([row[ID], original, hashvalue, row[SIZE], row[URI]])
+            if skip:
+               continue
+            if annotate:
+               row = newrecord(recordtype, row + (original,))
+            yield row
+      finally:
+         if report is not None:
+            report.close()
+         indexbytes = 3 * len(self.firsts) * self.firsts.itemsize
+         for values in [self.hashes, self.sizes, self.ids]:
+            indexbytes += sys.getsizeof(values) + sum([sys.getsizeof(value) for value in values])
+         counts['indexmb'] = round(float(indexbytes) / (1024 * 1024), 1)
@@ -0,0 +1,153 @@
+import os
+import hashlib
+import threading
+import collections
+from multiprocessing.pool import ThreadPool
+from droidscanclass import fsencode
+
+#DROID names the hash column for the algorithm it was asked to use
+ALGORITHMS = { 'MD5_HASH': 'md5', 'SHA1_HASH': 'sha1', 'SHA256_HASH': 'sha256' }
+
+#Fills in the hash DROID left empty, e.g. for a report run without hashing,
+#by hashing the file on disk with the algorithm of the hash column the config
+#maps. Files are hashed on a pool of threads, file reads and hashlib let go of
+#the GIL for large blocks, with at most pervolume files read at once from any
+#one volume so a slow disk isn't thrashed by seeks. Rows come out in the
+#order they went in. Hashes are kept in a cache file keyed on path, size and
+#modification time, so a file unchanged since an earlier run isn't hashed again
+class RosettaCSVFixity:
+
+   #bytes read and hashed at a time
+   BLOCKSIZE = 1024 * 1024
+
+   THREADS = 8
+   PERVOLUME = 4
+
+   #rows read ahead of the row being mapped, per thread
+   READAHEAD = 16
+
+   def __init__(self, hashcolumn, threads=THREADS, cachefile=False, pervolume=PERVOLUME):
+      self.hashcolumn = hashcolumn
+      self.algorithm = ALGORITHMS[hashcolumn]
+      self.threads = threads
+      self.pervolume = pervolume
+      self.cachefile = cachefile
+      self.volumes = {}
+      self.volumelock = threading.Lock()
+      self.counts = { 'hashed': 0, 'cached': 0, 'missing': 0 }
+      self.cache = self.__loadcache__()
+
+   #one line per hash, algorithm, size, modification time, hash and path,
+   #tab separated, the path last as it could have a tab in it. A file hashed
+   #again, once it has changed, has a later line which wins
+   def __loadcache__(self):
+      cache = {}
+      if self.cachefile and os.path.exists(self.cachefile):
+         with open(self.cachefile, 'rb') as cachefile:
+            for line in cachefile:
+               fields = line.rstrip('\n').split('\t', 4)
+               if len(fields) == 5 and fields[0] == self.algorithm:
+                  algorithm, size, mtime, digest, path = fields
+                  cache[(path.decode('utf-8'), size, mtime)] = digest.decode('ascii')
+      return cache
+
+   #failing to cache isn't a reason to fail the run
+   def __cachehash__(self, cachefile, key, digest):
+      path, size, mtime = key
+      if cachefile is None or u'\n' in path:
+         return cachefile
+      try:
+         cachefile.write('\t'.join([self.algorithm, size, mtime, digest.encode('ascii'), path.encode('utf-8')]) + '\n')
+      except IOError:
+         cachefile = None
+      return cachefile
+
+   def __opencache__(self):
+      if not self.cachefile:
+         return None
+      try:
+         cachedir = os.path.dirname(os.path.abspath(self.cachefile))
+         if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+         return open(self.cachefile, 'ab')
+      except (IOError, OSError):
+         return None
+
+   #files on one device share a semaphore, however they're named
+   def __volume__(self, device):
+      with self.volumelock:
+         volume = self.volumes.get(device)
+         if volume is None:
+            volume = self.volumes[device] = threading.BoundedSemaphore(self.pervolume)
+      return volume
+
+   #run on the pool. Returns the hash, or None if the file can't be read,
+   #and the cache key if it was hashed rather than found in the cache
+   def hashfile(self, path):
+      fspath = fsencode(path)
+      try:
+         st = os.stat(fspath)
+      except OSError:
+         return None, None
+      key = (path, str(st.st_size), repr(st.st_mtime))
+      digest = self.cache.get(key)
+      if digest is not None:
+         return digest, None
+      hashed = hashlib.new(self.algorithm)
+      blocksize = self.BLOCKSIZE
+      try:
+         with self.__volume__(st.st_dev):
+            with open(fspath, 'rb') as f:
+               read = f.read
+               block = read(blocksize)
+               while block:
+                  hashed.update(block)
+                  block = read(blocksize)
+      except IOError:
+         return None, None
+      return unicode(hashed.hexdigest()), key
+
+   #yields rows with an empty hash given the hash of the file. Files inside
+   #containers, and files already hashed by DROID, are passed through as
+   #they are. droidcolumns are the columns of the rows
+   def hashrows(self, droidrows, droidcolumns):
+      HASH = droidcolumns.index(self.hashcolumn)
+      PATH = droidcolumns.index('FILE_PATH')
+      URI = droidcolumns.index('URI')
+      readahead = self.threads * self.READAHEAD
+      pending = collections.deque()
+      cachefile = self.__opencache__()
+      pool = ThreadPool(self.threads)
+      try:
+         for row in droidrows:
+            if row[HASH] or not row[URI].startswith(u'file:'):
+               pending.append((row, None))
+            else:
+               pending.append((row, pool.apply_async(self.hashfile, (row[PATH],))))
+            while len(pending) > readahead:
+               row, cachefile = self.__hashedrow__(pending.popleft(), HASH, cachefile)
+               yield row
+         while pending:
+            row, cachefile = self.__hashedrow__(pending.popleft(), HASH, cachefile)
+            yield row
+      finally:
+         #files still being hashed, if we stopped early, aren't waited for
+         pool.terminate()
+         pool.join()
+         if cachefile is not None:
+            cachefile.close()
+
+   def __hashedrow__(self, pendingrow, HASH, cachefile):
+      row, result = pendingrow
+      if result is None:
+         return row, cachefile
+      digest, key = result.get()
+      if digest is None:
+         self.counts['missing']+=1
+         return row, cachefile
+      if key is None:
+         self.counts['cached']+=1
+      else:
+         self.counts['hashed']+=1
+         cachefile = self.__cachehash__(cachefile, key, digest)
+      return tuple.__new__(type(row), row[:HASH] + (digest,) + row[HASH + 1:]), cachefile
@@ -0,0 +1,68 @@
+import heapq
+import cPickle
+import tempfile
+
+#Sorts DROID rows into the groups they belong to, e.g. their directory, so
+#a group's rows can be written one after another. Rows are sorted a run of
+#runsize at a time in memory, each run but the last written to a temporary
+#file, then the runs are merged, so memory use doesn't depend on the size of
+#the report. Within a group rows keep the order of the report. Temporary
+#files go where tempfile puts them, e.g. TMPDIR, unless tempdir is given
+class RosettaCSVGrouper:
+
+   #rows sorted in memory at a time
+   RUNSIZE = 100000
+
+   #rows pickled at a time, a pickle a row is much slower to read back
+   CHUNKSIZE = 1000
+
+   def __init__(self, groupkey, runsize=RUNSIZE, tempdir=None):
+      self.groupkey = groupkey
+      self.runsize = runsize
+      self.tempdir = tempdir
+      #runs written to disk by the last groupedrows
+      self.runfiles = 0
+
+   #the rows' own type is made on the fly by droidrecordtype, it can't be
+   #pickled, so rows are written as plain tuples
+   def __writerun__(self, run):
+      run.sort()
+      runfile = tempfile.TemporaryFile(dir=self.tempdir)
+      for start in xrange(0, len(run), self.CHUNKSIZE):
+         cPickle.dump(run[start:start + self.CHUNKSIZE], runfile, cPickle.HIGHEST_PROTOCOL)
+      runfile.seek(0)
+      return runfile
+
+   def __readrun__(self, runfile):
+      try:
+         while True:
+            for record in cPickle.load(runfile):
+               yield record
+      except EOFError:
+         runfile.close()
+
+   #yields rows a group at a time, groups in order of their key
+   def groupedrows(self, rows):
+      groupkey = self.groupkey
+      runsize = self.runsize
+      run = []
+      runfiles = []
+      rowtype = tuple
+      sequence = 0
+      for row in rows:
+         rowtype = type(row)
+         #the sequence keeps report order within a group, and as it's
+         #unique rows are never compared themselves
+         run.append((groupkey(row), sequence, tuple(row)))
+         sequence+=1
+         if len(run) >= runsize:
+            runfiles.append(self.__writerun__(run))
+            run = []
+      self.runfiles = len(runfiles)
+      run.sort()
+      records = run
+      if runfiles:
+         records = heapq.merge(iter(run), *[self.__readrun__(runfile) for runfile in runfiles])
+      newrecord = tuple.__new__
+      for key, sequence, values in records:
+         yield newrecord(rowtype, values)
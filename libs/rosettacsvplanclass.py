@@ -0,0 +1,256 @@
+import os
+from urlparse import urlparse
+from rosettapathcacheclass import RosettaPathCache
+
+#Compiles the config, schema and sections into a flat list of per-column
+#extractors once, so mapping a DROID row is just applying N precompiled
+#functions instead of querying the ConfigParser for every field of every row
+class RosettaCSVPlan:
+
+   #default two represents Object Type and SIP Title (see schema), the
+   #first column a field from the config can go in
+   CSVINDEXSTARTPOS = 2
+
+   #extractor kinds, kept as plain tuples so the plan itself is simple data
+   STATIC = 'static'             #value known from config, pre-quoted
+   DROID = 'droid'               #value from a DROID column
+   LOCATION = 'location'         #directory of a DROID path, pathmask removed
+   ZIPLOCATION = 'ziplocation'   #directory inside a container, from URI
+   ZIPTITLE = 'ziptitle'         #name of the container, known at runtime
+   GROUPTITLE = 'grouptitle'     #directory of an IE's files, see groupIE
+
+   LOCATIONFIELDS = ['File Location', 'File Original Path']
+   TITLEFIELDS = ['Title', 'Title(DC)']      #Title(DC) added for future configuration
+
+   #an IE per directory is titled by its directory, whatever the config says
+   GROUPTITLEFIELDS = TITLEFIELDS + ['Title (DC)']
+
+   def __init__(self, config, rosettacsvdict, rosettasections, includezips=False, singleIE=False, rosettacsvindex=None,
+                groupIE=False, groupdepth=None):
+      self.includezips = includezips
+      self.singleIE = singleIE
+      #an IE per directory, or per directory groupdepth folders below the
+      #pathmask, see groupkeyfunction
+      self.groupIE = groupIE
+      self.groupdepth = groupdepth
+      self.columnnames = [field['name'] for field in rosettacsvdict]
+      #schema field name: column, see JSONTableSchema.field_index
+      if rosettacsvindex is None:
+         rosettacsvindex = dict([(name, i) for i, name in enumerate(self.columnnames)])
+      self.columnindex = rosettacsvindex
+
+      self.pathmask = u''
+      if config.has_option('path values', 'pathmask'):
+         self.pathmask = config.get('path values', 'pathmask').decode('utf-8')
+
+      #rosettasections is a list of single entry dicts, section: fieldlist
+      sections = [(section.keys()[0], section.values()[0]) for section in rosettasections]
+      self.firstplan, self.plan = self.__compile__(config, sections)
+
+      #DROID columns the plan reads, everything else can be left unparsed
+      self.droidcolumns = []
+      for section, specs in self.firstplan + self.plan:
+         for csvindex, kind, arg in specs:
+            if kind in [self.DROID, self.LOCATION, self.ZIPLOCATION] and arg not in self.droidcolumns:
+               self.droidcolumns.append(arg)
+      if groupIE and self.groupcolumn() not in self.droidcolumns:
+         self.droidcolumns.append(self.groupcolumn())
+
+   def add_csv_value(self, value):
+      if type(value) is int:
+         return '"' + str(value) + '"'
+      return '"' + value.encode('utf-8') + '"'
+
+   #mirrors the order of precedence config sections have always had
+   def __fieldspec__(self, config, field):
+      if self.groupIE and field in self.GROUPTITLEFIELDS:
+         return (self.GROUPTITLE, None)
+      if config.has_option('rosetta mapping', field):
+         rosettafield = config.get('rosetta mapping', field)
+         if field in self.TITLEFIELDS and self.singleIE:
+            if self.includezips:
+               if config.has_option('application configuration', 'ziptitle'):
+                  return (self.STATIC, config.get('application configuration', 'ziptitle'))
+               return (self.ZIPTITLE, None)
+            return (self.STATIC, rosettafield)
+         return (self.DROID, rosettafield)
+      elif config.has_option('static values', field):
+         return (self.STATIC, config.get('static values', field))
+      elif config.has_option('droid mapping', field):
+         rosettafield = config.get('droid mapping', field)
+         if field in self.LOCATIONFIELDS:
+            if self.includezips:
+               return (self.ZIPLOCATION, 'URI')
+            return (self.LOCATION, rosettafield)
+         return (self.DROID, rosettafield)
+      #If we haven't a value, add a blank field...
+      return (self.STATIC, '')
+
+   #each field goes to the schema column of the same name. A field the
+   #schema doesn't have, or one of the Object Type and SIP Title columns
+   #every row starts with, is left out
+   def __mapsection__(self, config, fields):
+      specs = []
+      for field in fields:
+         csvindex = self.columnindex.get(field)
+         if csvindex is not None and csvindex >= self.CSVINDEXSTARTPOS:
+            kind, arg = self.__fieldspec__(config, field)
+            specs.append((csvindex, kind, arg))
+      return specs
+
+   #returns the plan for the first DROID item and the plan for every item
+   #after it. For a single IE the IE and REPRESENTATION sections are output
+   #once, with the first item, and their columns are left empty thereafter
+   def __compile__(self, config, sections):
+      firstplan = [(section, self.__mapsection__(config, fields)) for section, fields in sections]
+      plan = firstplan
+      sectionnames = [section for section, fields in sections]
+      if (self.singleIE or self.groupIE) and 'IE' in sectionnames and 'REPRESENTATION' in sectionnames:
+         plan = [(section, specs) for section, specs in firstplan if section not in ['IE', 'REPRESENTATION']]
+      return firstplan, plan
+
+   def __extractor__(self, kind, arg, zipname, columnindex):
+      quote = self.add_csv_value
+      pathmask = self.pathmask
+      #rows are dicts keyed by column name, or tuples indexed by position
+      if columnindex and arg in columnindex:
+         arg = columnindex[arg]
+      if kind == self.DROID:
+         return lambda item: '"' + item[arg].encode('utf-8') + '"'
+      if kind == self.LOCATION:
+         #the directory is all that changes the value, so it is transformed
+         #once per distinct parent path, not once per file
+         def locationvalue(parent):
+            value = (os.path.dirname(parent) + u'\\').replace(pathmask, u'').replace(u'\\', u'/')
+            #TODO: Test against other cases, workaround for no directory structure in ZIP
+            if value == u'/':
+               value = u''
+            return '"' + value.encode('utf-8') + '"'
+         cache = self.__pathcache__(locationvalue)
+         #keyed on the path up to its last separator of either kind, a DROID
+         #report can have Windows paths wherever it is read. os.path.dirname
+         #only splits on separators in the key, so gives the same directory
+         def location(item):
+            path = item[arg]
+            end = max(path.rfind(u'/'), path.rfind(u'\\')) + 1
+            #no separator, e.g. C:file, the drive is still the directory
+            if end == 0:
+               return locationvalue(path)
+            return cache.get(path[:end])
+         return location
+      if kind == self.ZIPLOCATION:
+         #as above, keyed on the URI up to the last slash
+         def ziplocationvalue(parent):
+            value = u'/'.join(urlparse(parent).path.split(u'/')[1:-1]).replace(pathmask, u'').replace(u'\\', u'/') + u'/'
+            return '"' + value.encode('utf-8') + '"'
+         cache = self.__pathcache__(ziplocationvalue)
+         def ziplocation(item):
+            uri = item[arg]
+            return cache.get(uri[:uri.rfind(u'/') + 1])
+         return ziplocation
+      if kind == self.ZIPTITLE:
+         value = quote(zipname)
+         return lambda item: value
+      if kind == self.GROUPTITLE:
+         groupkey = self.__groupkey__(columnindex, self.groupdepth)
+         grouptitle = self.grouptitle
+         return lambda item: quote(grouptitle(groupkey(item)))
+
+   #the column files are grouped on, files in a container are grouped by
+   #their directory in the container
+   def groupcolumn(self):
+      if self.includezips:
+         return 'URI'
+      return 'FILE_PATH'
+
+   def __groupkey__(self, columnindex, depth):
+      pathmask = self.pathmask
+      includezips = self.includezips
+      column = self.groupcolumn()
+      arg = columnindex.get(column, column) if columnindex else column
+      #a file's directory as a relative path with / between folders, cut to
+      #depth folders. Worked out once per distinct parent
+      def groupvalue(parent):
+         if includezips:
+            parent = u'/'.join(urlparse(parent).path.split(u'/')[1:-1]) + u'/'
+         value = parent.replace(pathmask, u'').replace(u'\\', u'/').strip(u'/')
+         if depth:
+            value = u'/'.join(value.split(u'/')[:depth])
+         return value
+      cache = RosettaPathCache(groupvalue)
+      def groupkey(item):
+         path = item[arg]
+         return cache.get(path[:max(path.rfind(u'/'), path.rfind(u'\\')) + 1])
+      return groupkey
+
+   #the key of the group, the IE, an item belongs to, its directory cut to
+   #depth folders, groupdepth unless given. columns is the projection rows
+   #are read with, as for bind
+   def groupkeyfunction(self, columns=False, depth=False):
+      columnindex = {}
+      if columns:
+         columnindex = dict([(column, i) for i, column in enumerate(columns)])
+      if depth is False:
+         depth = self.groupdepth
+      return self.__groupkey__(columnindex, depth)
+
+   #files at the top, under the pathmask, are titled by its last folder
+   def grouptitle(self, groupkey):
+      if groupkey:
+         return groupkey
+      return self.pathmask.replace(u'\\', u'/').strip(u'/').split(u'/')[-1] or u'/'
+
+   def __pathcache__(self, transform):
+      cache = RosettaPathCache(transform)
+      self.pathcaches.append(cache)
+      return cache
+
+   #turns a plan into (template row, [(csvindex, extractor)]) per section,
+   #static values are already in the template so only DROID values remain
+   def __bindplan__(self, plan, zipname, columnindex):
+      boundplan = []
+      for section, specs in plan:
+         template = ['""'] * len(self.columnnames)
+         template[0] = self.add_csv_value(section)
+         extractors = []
+         for csvindex, kind, arg in specs:
+            if kind == self.STATIC:
+               template[csvindex] = self.add_csv_value(arg)
+            else:
+               extractors.append((csvindex, self.__extractor__(kind, arg, zipname, columnindex)))
+         boundplan.append((template, extractors))
+      return boundplan
+
+   #zipname is only known once the DROID report has been read. columns
+   #is the projection rows are read with, if rows are tuples not dicts
+   def bind(self, zipname='', columns=False):
+      columnindex = {}
+      if columns:
+         columnindex = dict([(column, i) for i, column in enumerate(columns)])
+      self.pathcaches = []
+      self.boundfirstplan = self.__bindplan__(self.firstplan, zipname, columnindex)
+      self.boundplan = self.__bindplan__(self.plan, zipname, columnindex)
+
+   #hits and misses of the path caches since bind, or the last reset
+   def cachestats(self):
+      stats = { 'hits': 0, 'misses': 0, 'size': 0 }
+      for cache in getattr(self, 'pathcaches', []):
+         for key, value in cache.stats().items():
+            if key in stats:
+               stats[key]+=value
+      lookups = stats['hits'] + stats['misses']
+      stats['hitrate'] = round(float(stats['hits']) / lookups, 4) if lookups else 0.0
+      return stats
+
+   def resetcachestats(self):
+      for cache in getattr(self, 'pathcaches', []):
+         cache.resetstats()
+
+   def maprow(self, item, first=False):
+      rows = []
+      for template, extractors in (self.boundfirstplan if first else self.boundplan):
+         row = template[:]
+         for csvindex, extractor in extractors:
+            row[csvindex] = extractor(item)
+         rows.append(row)
+      return rows
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+from atomicfileclass import replacefile
+
+#Reports how far through the DROID report a run is: rows read, items
+#mapped, rows a second, bytes read of the report's size, or rows read of
+#its rows once they're counted, see countrows, and an estimate of the time
+#left. Written as a line to stderr and/or as JSON to a status file,
+#e.g. for a scheduler to poll. The clock is only looked at every SAMPLEROWS
+#rows and a report only made every interval seconds, so tracking costs the
+#read loop little more than a count
+class RosettaCSVProgress:
+
+   #rows between looks at the clock
+   SAMPLEROWS = 1000
+
+   #seconds between reports
+   INTERVAL = 5.0
+
+   def __init__(self, csvgen, interval=INTERVAL, statusfile=False, out=sys.stderr):
+      self.csvgen = csvgen
+      self.interval = interval
+      self.statusfile = statusfile
+      self.out = out
+      #a scanned directory has no size to read through
+      self.totalbytes = os.path.getsize(csvgen.droidcsv) if os.path.isfile(csvgen.droidcsv) else None
+      self.started = time.time()
+      self.reported = self.started
+      self.rowsread = 0
+      self.bytesread = None
+      self.totalrows = None
+
+   #counts the report's rows, a quick scan of a memory mapped report, so
+   #progress and the time left are in rows rather than bytes, which a
+   #report of rows of very different lengths reads through unevenly
+   def countrows(self, csvhandler):
+      if self.totalrows is None:
+         self.totalrows = csvhandler.csvrowcount(self.csvgen.droidcsv)
+
+   #yields rows unchanged, counting them, bytesread is called for how far
+   #through the report they have been read from
+   def track(self, rows, bytesread):
+      clock = time.time
+      samplerows = self.SAMPLEROWS
+      count = self.rowsread
+      for row in rows:
+         count+=1
+         if count % samplerows == 0 and clock() - self.reported >= self.interval:
+            self.update(count, bytesread())
+         yield row
+      self.rowsread = count
+
+   #rows read and bytes read so far, e.g. after each shard is written
+   def update(self, rowsread, bytesread=None):
+      self.rowsread = rowsread
+      self.bytesread = bytesread
+      now = time.time()
+      if now - self.reported >= self.interval:
+         self.reported = now
+         self.report('running')
+
+   def status(self, state):
+      elapsed = time.time() - self.started
+      status = { 'state': state, 'droidcsv': self.csvgen.droidcsv, 'rowsread': self.rowsread, 'items': self.csvgen.itemcount,
+                 'seconds': round(elapsed, 1), 'rowspersecond': round(self.rowsread / elapsed) if elapsed else None,
+                 'bytesread': self.bytesread, 'totalbytes': self.totalbytes, 'totalrows': self.totalrows,
+                 'percent': None, 'etaseconds': None }
+      if self.totalrows is not None:
+         if self.rowsread:
+            status['percent'] = round(100.0 * self.rowsread / self.totalrows, 1)
+            status['etaseconds'] = round(elapsed * max(0, self.totalrows - self.rowsread) / self.rowsread, 1)
+      elif self.bytesread and self.totalbytes is not None:
+         status['percent'] = round(100.0 * self.bytesread / self.totalbytes, 1) if self.totalbytes else 100.0
+         status['etaseconds'] = round(elapsed * max(0, self.totalbytes - self.bytesread) / self.bytesread, 1)
+      if state == 'done' and self.totalbytes is not None:
+         status['percent'] = 100.0
+         status['etaseconds'] = 0.0
+      return status
+
+   def report(self, state):
+      status = self.status(state)
+      if self.out is not None:
+         self.out.write(self.formatstatus(status) + "\n")
+         self.out.flush()
+      if self.statusfile:
+         #renamed into place so a reader never sees part of a status
+         tmpname = self.statusfile + '.tmp'
+         with open(tmpname, 'wb') as statusfile:
+            json.dump(status, statusfile, indent=2)
+         replacefile(tmpname, self.statusfile)
+
+   def formatstatus(self, status):
+      line = "%s: %d rows read, %d items, %s rows/s" % (status['state'], status['rowsread'], status['items'], status['rowspersecond'])
+      if status['percent'] is not None and status['totalrows'] is not None:
+         line += ", %d of %d rows (%.1f%%), ETA %s" % (status['rowsread'], status['totalrows'], status['percent'],
+                                                     self.formatseconds(status['etaseconds']))
+      elif status['percent'] is not None:
+         line += ", %.1f of %.1fMB (%.1f%%), ETA %s" % ((status['bytesread'] or self.totalbytes) / 1048576.0, self.totalbytes / 1048576.0,
+                                                      status['percent'], self.formatseconds(status['etaseconds']))
+      return line
+
+   def formatseconds(self, seconds):
+      minutes, seconds = divmod(int(seconds), 60)
+      hours, minutes = divmod(minutes, 60)
+      return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+   #the last report, once the sheet is written
+   def finish(self):
+      self.bytesread = self.totalbytes
+      self.report('done')
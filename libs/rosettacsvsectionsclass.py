@@ -1,3 +1,4 @@
+import sys
 import ConfigParser
 
 class RosettaCSVSections:
@@ -5,9 +6,16 @@ class RosettaCSVSections:
    sections = []
    
    def __init__(self, configfile):
- 
-      self.config = ConfigParser.RawConfigParser()
-      self.config.read(configfile)   
+
+      #per instance, a class level list grows with every instance created
+      self.sections = []
+
+      #an already parsed config can be passed so the file is only read once
+      if isinstance(configfile, ConfigParser.RawConfigParser):
+         self.config = configfile
+      else:
+         self.config = ConfigParser.RawConfigParser()
+         self.config.read(configfile)
 
       #TODO: handle null/wrong CFG file better
 
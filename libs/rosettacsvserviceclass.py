@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import glob
+import time
+import signal
+import tempfile
+import threading
+import collections
+import multiprocessing
+import SocketServer
+import BaseHTTPServer
+
+#each worker process keeps a compiled generator for every config and schema
+#pair, so a job only reads its DROID report, see initserviceworker
+servicegenerators = {}
+servicecachedir = False
+
+#a pair is compiled again if the config or schema has changed since
+def compiledgenerator(configfile, rosettaschema):
+   stamp = (os.path.getmtime(configfile), os.path.getmtime(rosettaschema))
+   compiled = servicegenerators.get((configfile, rosettaschema))
+   if compiled is None or compiled[0] != stamp:
+      #import here, the generator isn't needed until a worker starts
+      from RosettaCSVGenerator import RosettaCSVGenerator
+      compiled = (stamp, RosettaCSVGenerator(False, rosettaschema, configfile, cachedir=servicecachedir))
+      servicegenerators[(configfile, rosettaschema)] = compiled
+   return compiled[1]
+
+#every pair is compiled as the worker starts, so no job waits on a compile
+def initserviceworker(configdir, schemadir, cachedir=False):
+   global servicecachedir
+   servicecachedir = cachedir
+   for configfile in sorted(glob.glob(os.path.join(configdir, '*.cfg'))):
+      for rosettaschema in sorted(glob.glob(os.path.join(schemadir, '*.json'))):
+         try:
+            compiledgenerator(configfile, rosettaschema)
+         except (SystemExit, Exception):
+            #a pair that doesn't compile fails its jobs with the reason why
+            pass
+
+def generatejob(job):
+   started = time.time()
+   result = { 'id': job['id'], 'droidcsv': job['droidcsv'], 'config': os.path.basename(job['configfile']),
+              'schema': os.path.basename(job['rosettaschema']), 'queueseconds': round(started - job['submitted'], 3),
+              'items': 0, 'rows': 0, 'filtercounts': {}, 'violations': None, 'error': '' }
+   try:
+      csvgen = compiledgenerator(job['configfile'], job['rosettaschema']).forreport(job['droidcsv'], job['outfile'])
+      if job['validate']:
+         csvgen.validate()
+      csvgen.export2rosettacsv()
+      result['items'] = csvgen.itemcount
+      result['rows'] = csvgen.rowcount
+      result['filtercounts'] = csvgen.filtercounts
+      if csvgen.validator is not None:
+         result['violations'] = csvgen.validator.report()['violations']
+   except SystemExit as e:
+      #e.g. an empty listing, the service carries on
+      result['error'] = str(e.code)
+   except Exception as e:
+      result['error'] = e.__class__.__name__ + ': ' + str(e)
+   result['seconds'] = round(time.time() - started, 3)
+   return result
+
+#Generates Rosetta CSVs for jobs sent over HTTP, on localhost or a Unix
+#socket, so a job doesn't pay for starting Python or compiling its config
+#and schema. Requests are taken on threads of their own and handed to a pool
+#of worker processes, each with every config and schema pair compiled. At
+#most workers jobs run and queuesize wait at once, a job over that is turned
+#away with 503 so the caller backs off. Sheets are spooled to a temporary
+#file and streamed back a block at a time, never held in memory
+class RosettaCSVService:
+
+   QUEUESIZE = 8
+
+   #finished jobs kept for /metrics
+   KEEPJOBS = 100
+
+   #largest job request read
+   MAXREQUEST = 64 * 1024
+
+   BLOCKSIZE = 64 * 1024
+
+   def __init__(self, configdir, schemadir, workers=1, queuesize=QUEUESIZE, cachedir=False, spooldir=None):
+      self.configdir = configdir
+      self.schemadir = schemadir
+      self.workers = workers
+      self.queuesize = queuesize
+      self.cachedir = cachedir
+      self.spooldir = spooldir
+      self.slots = threading.BoundedSemaphore(workers + queuesize)
+      self.lock = threading.Lock()
+      self.lastid = 0
+      self.jobs = collections.deque(maxlen=self.KEEPJOBS)
+      self.totals = { 'accepted': 0, 'rejected': 0, 'failed': 0, 'active': 0, 'items': 0, 'rows': 0, 'seconds': 0.0 }
+      self.pool = None
+
+   #workers are started before any request thread, they're forked from us
+   def start(self):
+      self.pool = multiprocessing.Pool(self.workers, initserviceworker, (self.configdir, self.schemadir, self.cachedir))
+
+   def stop(self):
+      if self.pool is not None:
+         self.pool.terminate()
+         self.pool.join()
+         self.pool = None
+
+   #configs and schemas are asked for by name, nothing outside their directory
+   def resolve(self, directory, name):
+      if not name or os.path.basename(name) != name:
+         return None
+      path = os.path.join(directory, name)
+      if not os.path.isfile(path):
+         return None
+      return path
+
+   #returns the job and its pending result, or None if the queue is full
+   def submit(self, droidcsv, configfile, rosettaschema, validate=False):
+      if not self.slots.acquire(False):
+         with self.lock:
+            self.totals['rejected']+=1
+         return None
+      with self.lock:
+         self.lastid+=1
+         jobid = self.lastid
+         self.totals['accepted']+=1
+         self.totals['active']+=1
+      fd, outfile = tempfile.mkstemp(prefix='rosetta-job%d-' % jobid, suffix='.csv', dir=self.spooldir)
+      os.close(fd)
+      job = { 'id': jobid, 'droidcsv': droidcsv, 'configfile': configfile, 'rosettaschema': rosettaschema,
+              'validate': validate, 'outfile': outfile, 'submitted': time.time() }
+      return job, self.pool.apply_async(generatejob, (job,))
+
+   #waits for a job, its slot is free for another once it's done
+   def wait(self, pending):
+      try:
+         result = pending.get()
+      finally:
+         self.slots.release()
+      with self.lock:
+         self.totals['active']-=1
+         if result['error']:
+            self.totals['failed']+=1
+         self.totals['items']+=result['items']
+         self.totals['rows']+=result['rows']
+         self.totals['seconds']+=result['seconds']
+         self.jobs.append(result)
+      return result
+
+   def metrics(self):
+      with self.lock:
+         return { 'workers': self.workers, 'queuesize': self.queuesize, 'totals': dict(self.totals), 'jobs': list(self.jobs) }
+
+   def server(self, port=None, socketpath=None):
+      if socketpath:
+         server = ThreadingUnixHTTPServer(socketpath, RosettaCSVRequestHandler)
+      else:
+         server = ThreadingHTTPServer(('127.0.0.1', port), RosettaCSVRequestHandler)
+      server.service = self
+      return server
+
+   def serve(self, port=None, socketpath=None):
+      if socketpath and os.path.exists(socketpath):
+         sys.exit("ERROR: " + socketpath + " exists, is the service already running?")
+      self.start()
+      server = self.server(port, socketpath)
+      #stopped by a service manager, workers keep the default handler
+      signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+      try:
+         server.serve_forever()
+      except KeyboardInterrupt:
+         pass
+      finally:
+         server.server_close()
+         self.stop()
+         if socketpath and os.path.exists(socketpath):
+            os.remove(socketpath)
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+   daemon_threads = True
+
+class ThreadingUnixHTTPServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+   daemon_threads = True
+
+#POST /generate with a JSON job, {"csv": DROID report on this host, "cfg":
+#config name, "ros": schema name, "validate": true or false}, returns the
+#sheet, with the job's figures in X-Rosetta headers. GET /metrics returns
+#totals and the last finished jobs as JSON
+class RosettaCSVRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+   #a Unix socket has no client address
+   def address_string(self):
+      if isinstance(self.client_address, tuple):
+         return self.client_address[0]
+      return 'local'
+
+   def log_message(self, format, *args):
+      sys.stderr.write("%s - - [%s] %s\n" % (self.address_string(), self.log_date_time_string(), format % args))
+
+   def sendjson(self, code, value, headers=()):
+      body = json.dumps(value, indent=2)
+      self.send_response(code)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(body)))
+      for header, headervalue in headers:
+         self.send_header(header, headervalue)
+      self.end_headers()
+      self.wfile.write(body)
+
+   def do_GET(self):
+      if self.path == '/metrics':
+         self.sendjson(200, self.server.service.metrics())
+      else:
+         self.sendjson(404, { 'error': 'Not found, GET /metrics or POST /generate.' })
+
+   def readjob(self):
+      length = int(self.headers.get('Content-Length') or 0)
+      if length > RosettaCSVService.MAXREQUEST:
+         return None
+      try:
+         job = json.loads(self.rfile.read(length))
+      except ValueError:
+         return None
+      if not isinstance(job, dict):
+         return None
+      return job
+
+   def do_POST(self):
+      service = self.server.service
+      if self.path != '/generate':
+         return self.sendjson(404, { 'error': 'Not found, POST /generate.' })
+      job = self.readjob()
+      if job is None:
+         return self.sendjson(400, { 'error': 'Job should be a JSON object, with csv, cfg and ros.' })
+      configfile = service.resolve(service.configdir, job.get('cfg'))
+      rosettaschema = service.resolve(service.schemadir, job.get('ros'))
+      droidcsv = job.get('csv')
+      if configfile is None or rosettaschema is None:
+         return self.sendjson(404, { 'error': 'No config ' + repr(job.get('cfg')) + ' or schema ' + repr(job.get('ros')) + '.' })
+      if not droidcsv or not os.path.isfile(droidcsv):
+         return self.sendjson(404, { 'error': 'No DROID report ' + repr(droidcsv) + '.' })
+      submitted = service.submit(droidcsv, configfile, rosettaschema, bool(job.get('validate')))
+      if submitted is None:
+         return self.sendjson(503, { 'error': 'Queue full, try again shortly.' }, [('Retry-After', '1')])
+      job, pending = submitted
+      try:
+         result = service.wait(pending)
+         if result['error']:
+            return self.sendjson(422, result)
+         self.sendsheet(job['outfile'], result)
+      finally:
+         os.remove(job['outfile'])
+
+   def sendsheet(self, outfile, result):
+      self.send_response(200)
+      self.send_header('Content-Type', 'text/csv; charset=utf-8')
+      self.send_header('Content-Length', str(os.path.getsize(outfile)))
+      for figure in ['id', 'items', 'rows', 'seconds', 'queueseconds', 'violations']:
+         if result[figure] is not None:
+            self.send_header('X-Rosetta-' + figure.capitalize(), str(result[figure]))
+      self.end_headers()
+      with open(outfile, 'rb') as sheet:
+         block = sheet.read(RosettaCSVService.BLOCKSIZE)
+         while block:
+            self.wfile.write(block)
+            block = sheet.read(RosettaCSVService.BLOCKSIZE)
@@ -0,0 +1,230 @@
+import sys
+import collections
+import multiprocessing
+from droidcsvhandlerclass import *
+from rosettacsvwriterclass import RosettaCSVWriter, rosettarow
+from rosettacsvstatsclass import RosettaCSVStats
+from compressedcsvclass import compression
+
+#classes of row filterrows counts, every row read is one of these
+ROWCLASSES = [droidCSVHandler.FOLDER, droidCSVHandler.FILE, droidCSVHandler.CONTAINER, droidCSVHandler.CONTAINERMEMBER]
+
+#each worker process compiles its own generator once, then maps shards
+shardgenerator = None
+
+#profile, return per-stage figures for each shard, see RosettaCSVStats
+shardprofile = False
+
+def initshardworker(droidcsv, rosettaschema, configfile, zipname, profile=False, cachedir=False, deltaindexfile=False, mmapinput=False):
+   global shardgenerator, shardprofile
+   shardprofile = profile
+   #import here, RosettaCSVGenerator imports this module
+   from RosettaCSVGenerator import RosettaCSVGenerator
+   shardgenerator = RosettaCSVGenerator(droidcsv, rosettaschema, configfile, cachedir=cachedir)
+   #each worker opens its own connection to the index the parent opened
+   if deltaindexfile:
+      shardgenerator.delta(deltaindexfile)
+   shardgenerator.zipname = zipname
+   shardgenerator.mmapinput = mmapinput
+   shardgenerator.mappingplan.bind(zipname, shardgenerator.droidcolumns)
+
+#maps one byte range of the DROID report. The first item of a shard is
+#rendered both ways, it is only the first item of the sheet if no earlier
+#shard had any rows, which only the parent process can know
+def mapshard(shard):
+   #a worker exiting would leave the pool waiting for its result forever
+   try:
+      return mapshardrows(shard)
+   except SystemExit as e:
+      raise RuntimeError(e.code)
+
+def mapshardrows(shard):
+   header_list, start, end = shard
+   droidcsvhandler = droidCSVHandler(shardgenerator.droidcolumns)
+   if shardprofile:
+      shardgenerator.stats = RosettaCSVStats()
+      shardgenerator.stats.start('map')
+   if shardgenerator.mmapinput:
+      droidlist = droidcsvhandler.streamDROIDCSVmapped(shardgenerator.droidcsv, start, end)
+   else:
+      droidlist = droidcsvhandler.streamDROIDCSVrange(shardgenerator.droidcsv, header_list, start, end)
+   droidlist = shardgenerator.__timed__('read', droidlist)
+   droidlist = shardgenerator.__timed__('filter', shardgenerator.filterDROIDrows(droidcsvhandler, droidlist), 'read')
+   mappingplan = shardgenerator.mappingplan
+   maprow = mappingplan.maprow
+   #caches live as long as the worker, stats are just for this shard
+   mappingplan.resetcachestats()
+
+   result = { 'end': end, 'items': 0, 'firstrows': 0, 'firsttext': '', 'restrows': 0, 'resttext': '',
+              'rows': 0, 'text': '', 'filtercounts': droidcsvhandler.counts, 'pathcachestats': {}, 'stats': {} }
+
+   for item in droidlist:
+      firstrows = maprow(item, True)
+      restrows = maprow(item, False)
+      break
+   else:
+      return shardstats(result)
+
+   itemcount = 1
+   rows = []
+   for item in droidlist:
+      for row in maprow(item, False):
+         rows.append(rosettarow(row))
+      itemcount+=1
+
+   result.update({ 'items': itemcount, 'firstrows': len(firstrows), 'firsttext': ''.join([rosettarow(row) for row in firstrows]),
+                   'restrows': len(restrows), 'resttext': ''.join([rosettarow(row) for row in restrows]),
+                   'rows': len(rows), 'text': ''.join(rows), 'pathcachestats': mappingplan.cachestats() })
+   return shardstats(result)
+
+#mapping the shard, rendering the rows included, is timed as the map stage
+def shardstats(result):
+   if shardprofile:
+      stats = shardgenerator.stats
+      stats.stop('map', 0, result['items'], 'filter')
+      result['stats'] = stats.stages
+   return result
+
+#Splits the DROID report into byte ranges on row boundaries, maps them in a
+#pool of processes and writes the results back out in the original order
+class RosettaCSVShards:
+
+   #bytes of DROID report per shard
+   CHUNKSIZE = 4 * 1024 * 1024
+
+   def __init__(self, csvgen, workers, chunksize=CHUNKSIZE):
+      self.csvgen = csvgen
+      self.workers = workers
+      self.chunksize = chunksize
+
+   def export2rosettacsv(self):
+      csvgen = self.csvgen
+      #shards are byte ranges, a compressed report would be read from the
+      #start by every worker
+      if compression(csvgen.droidcsv):
+         sys.exit("ERROR: A compressed DROID report can't be split between workers, use --workers 1.")
+      #files are hashed on threads of the one process
+      if csvgen.fixity is not None:
+         sys.exit("ERROR: Fixity is computed on threads of its own, use --workers 1.")
+      #every file is looked for among those before it
+      if csvgen.duplicates is not None:
+         sys.exit("ERROR: Duplicates are found across the whole report, use --workers 1.")
+      #a directory's files can be anywhere in the report
+      if csvgen.groupIE:
+         sys.exit("ERROR: An IE per directory can't be split between workers, use --workers 1.")
+      csvgen.filtercounts = {}
+      csvgen.pathcachestats = { 'hits': 0, 'misses': 0 }
+      droidcsvhandler = droidCSVHandler(csvgen.droidcolumns)
+      csvhandler = genericCSVHandler()
+      state = csvgen.resumestate
+
+      #single IE title is the zip name, needed before any shard is mapped
+      zipname = ''
+      resumeoffset = None
+      if state is not None:
+         zipname = state['zipname']
+         csvgen.filtercounts = dict(state['filtercounts'])
+         resumeoffset = state['inputoffset']
+      elif csvgen.__ziptitlerequired__():
+         zipname = csvgen.__findzipname__(droidcsvhandler)
+      csvgen.zipname = zipname
+
+      header_list, start = csvhandler.csvheader(csvgen.droidcsv)
+      #check the columns we need are there before any worker starts
+      csvhandler.csvprojection(csvgen.droidcsv, header_list, csvgen.droidcolumns)
+      if csvgen.mmapinput:
+         ranges = csvhandler.csvmappedrowranges(csvgen.droidcsv, self.chunksize, resumeoffset)
+         if csvgen.progress is not None:
+            csvgen.progress.countrows(csvhandler)
+      else:
+         ranges = csvhandler.csvrowranges(csvgen.droidcsv, self.chunksize, resumeoffset)
+      shards = [(header_list, start, end) for start, end in ranges]
+
+      profile = csvgen.stats is not None
+      deltaindexfile = csvgen.deltaindex.indexfile if csvgen.deltaindex is not None else False
+      pool = multiprocessing.Pool(self.workers, initshardworker, (csvgen.droidcsv, csvgen.rosettaschema, csvgen.configfile, zipname,
+                                  profile, csvgen.cachedir, deltaindexfile, csvgen.mmapinput))
+      csvwriter = None
+      if state is not None:
+         csvwriter = csvgen.__resumewriter__()
+      try:
+         #only a few shards in flight at once so results don't pile up in memory
+         pending = collections.deque()
+         for shard in shards:
+            pending.append(pool.apply_async(mapshard, (shard,)))
+            if len(pending) >= self.workers * 2:
+               csvwriter = self.__writeshard__(csvwriter, pending.popleft().get())
+         while pending:
+            csvwriter = self.__writeshard__(csvwriter, pending.popleft().get())
+         pool.close()
+      except RuntimeError as e:
+         pool.terminate()
+         sys.exit(str(e))
+      except:
+         pool.terminate()
+         raise
+      finally:
+         pool.join()
+         if csvwriter is not None:
+            csvwriter.close()
+
+      if csvwriter is None:
+         csvgen.__listingempty__()
+      csvgen.rowcount = csvwriter.rowcount - 1
+      if csvgen.checkpoint is not None:
+         csvgen.checkpoint.remove()
+
+      #size is per worker so isn't summed, only the lookups are
+      stats = csvgen.pathcachestats
+      lookups = stats['hits'] + stats['misses']
+      stats['hitrate'] = round(float(stats['hits']) / lookups, 4) if lookups else 0.0
+
+   #header and SIP row are written once the sheet is known not to be empty
+   def __writeshard__(self, csvwriter, result):
+      for rowclass, count in result['filtercounts'].items():
+         self.csvgen.filtercounts[rowclass] = self.csvgen.filtercounts.get(rowclass, 0) + count
+      for key in ['hits', 'misses']:
+         self.csvgen.pathcachestats[key]+=result['pathcachestats'].get(key, 0)
+      stats = self.csvgen.stats
+      if stats is not None:
+         stats.merge(result['stats'])
+      #shards are written in order, so the report has been read to the end of this one
+      if self.csvgen.progress is not None:
+         counts = self.csvgen.filtercounts
+         self.csvgen.progress.update(sum([counts.get(rowclass, 0) for rowclass in ROWCLASSES]), result['end'])
+      if result['items'] == 0:
+         return self.__checkpoint__(csvwriter, result)
+      self.csvgen.itemcount+=result['items']
+      if stats is not None:
+         stats.start('write')
+      validator = self.csvgen.validator
+      if csvwriter is None:
+         csvwriter = RosettaCSVWriter(self.csvgen.outfile, compressed=self.csvgen.outcompression)
+         csvwriter.writeheader(self.csvgen.rosettacsvheader)
+         siprow = self.csvgen.createsiprow()
+         if validator is not None:
+            validator.checkrow(siprow, True)
+         csvwriter.writerow(siprow)
+         written = csvwriter.rowcount
+         firsttext, firstrows = result['firsttext'], result['firstrows']
+      else:
+         written = csvwriter.rowcount
+         firsttext, firstrows = result['resttext'], result['restrows']
+      #rows only come back from workers rendered, so are checked as CSV text,
+      #here in the parent so unique values are seen across every shard
+      if validator is not None:
+         validator.checktext(firsttext)
+         validator.checktext(result['text'])
+      csvwriter.writerendered(firsttext, firstrows)
+      csvwriter.writerendered(result['text'], result['rows'])
+      #rows were mapped in the workers, map's time is theirs added up, not
+      #time spent here, so write's time is its own and has nothing taken off
+      if stats is not None:
+         stats.stop('write', result['items'], csvwriter.rowcount - written, None)
+      return self.__checkpoint__(csvwriter, result)
+
+   #a checkpoint after every shard written, shards are already large
+   def __checkpoint__(self, csvwriter, result):
+      if self.csvgen.checkpoint is not None and csvwriter is not None:
+         self.csvgen.__takecheckpoint__(csvwriter, result['end'])
+      return csvwriter
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+from rosettacsvwriterclass import RosettaCSVWriter
+from compressedcsvclass import uncompressedname
+from rosettacsvgroupclass import RosettaCSVGrouper
+
+#Splits the Rosetta CSV into a sheet per SIP. A new sheet, with its own
+#header, SIP row and single IE rows, is started once the next item would
+#take the sheet over maxfiles items or maxbytes of DROID SIZE. keepfolders
+#keeps each subtree that many folders below the pathmask in one sheet, so a
+#sheet can go over the limits by up to a subtree's files. A folder's files
+#needn't be together in a DROID report, so items are first sorted by their
+#subtree, on disk, see RosettaCSVGrouper. Items are streamed through, only
+#the current sheet is open, and each sheet written is listed in a JSON
+#manifest
+class RosettaCSVSplitter:
+
+   def __init__(self, csvgen, maxfiles=None, maxbytes=None, keepfolders=None):
+      self.csvgen = csvgen
+      self.maxfiles = maxfiles
+      self.maxbytes = maxbytes
+      self.keepfolders = keepfolders
+      self.sheets = []
+
+   #out.csv is written as out-0001.csv, out-0002.csv..., out.csv.gz as
+   #out-0001.csv.gz and so on
+   def sheetname(self, sheetno):
+      uncompressed = uncompressedname(self.csvgen.outfile)
+      root, ext = os.path.splitext(uncompressed)
+      return '%s-%04d%s%s' % (root, sheetno, ext or '.csv', self.csvgen.outfile[len(uncompressed):])
+
+   def manifestname(self):
+      return os.path.splitext(uncompressedname(self.csvgen.outfile))[0] + '-manifest.json'
+
+   #yields (new sheet, size, rows) for each item, the first item of a new
+   #sheet is mapped with the single IE rows
+   def __mapsheets__(self, droidlist):
+      csvgen = self.csvgen
+      csvgen.mappingplan.bind(csvgen.zipname, csvgen.rowcolumns())
+      maprow = csvgen.mappingplan.maprow
+      SIZE = csvgen.droidcolumns.index('SIZE')
+      subtreekey = self.__subtreekey__()
+      files = 0
+      bytes = 0
+      subtree = None
+      for item in droidlist:
+         size = int(item[SIZE] or 0)
+         itemsubtree = subtreekey(item) if subtreekey is not None else None
+         full = (self.maxfiles and files >= self.maxfiles) or (self.maxbytes and bytes + size > self.maxbytes)
+         newsheet = files == 0 or (full and (not self.keepfolders or itemsubtree != subtree))
+         if newsheet:
+            files = 0
+            bytes = 0
+         files+=1
+         bytes+=size
+         subtree = itemsubtree
+         csvgen.itemcount+=1
+         yield newsheet, size, maprow(item, newsheet)
+
+   #an item's folders relative to the pathmask, cut to keepfolders folders
+   def __subtreekey__(self):
+      if not self.keepfolders:
+         return None
+      return self.csvgen.mappingplan.groupkeyfunction(self.csvgen.droidcolumns, self.keepfolders)
+
+   def __closesheet__(self, csvwriter):
+      csvwriter.close()
+      self.sheets[-1]['rows'] = csvwriter.rowcount - 1
+
+   def __nextsheet__(self, csvwriter):
+      if csvwriter is not None:
+         self.__closesheet__(csvwriter)
+      sheet = self.sheetname(len(self.sheets) + 1)
+      self.sheets.append({ 'sheet': sheet, 'items': 0, 'rows': 0, 'bytes': 0 })
+      csvwriter = RosettaCSVWriter(sheet)
+      csvwriter.writeheader(self.csvgen.rosettacsvheader)
+      siprow = self.csvgen.createsiprow()
+      if self.csvgen.validator is not None:
+         self.csvgen.validator.checkrow(siprow, True)
+      csvwriter.writerow(siprow)
+      return csvwriter
+
+   def writemanifest(self):
+      with open(self.manifestname(), 'wb') as manifest:
+         json.dump({ 'droidcsv': self.csvgen.droidcsv, 'maxfiles': self.maxfiles, 'maxbytes': self.maxbytes,
+                     'keepfolders': self.keepfolders, 'sheets': self.sheets }, manifest, indent=2)
+
+   #rows are checked as they are written, validation is timed with writing
+   def export2rosettacsv(self):
+      csvgen = self.csvgen
+      if csvgen.workers > 1 or csvgen.checkpoint is not None:
+         sys.exit("ERROR: SIPs can't be split with more than one worker, or with checkpoints.")
+      if csvgen.groupIE:
+         sys.exit("ERROR: SIPs can't be split with an IE per directory.")
+      self.sheets = []
+      droidlist = csvgen.readDROIDCSV()
+      readstage = csvgen.readstage()
+      if self.keepfolders:
+         droidlist = csvgen.__timed__('group', RosettaCSVGrouper(self.__subtreekey__()).groupedrows(droidlist), readstage)
+         readstage = 'group'
+      sheetitems = csvgen.__timed__('map', self.__mapsheets__(droidlist), readstage)
+      validator = csvgen.validator
+      stats = csvgen.stats
+      if stats is not None:
+         stats.start('write')
+      csvwriter = None
+      try:
+         for newsheet, size, rows in sheetitems:
+            if newsheet:
+               csvwriter = self.__nextsheet__(csvwriter)
+            if validator is not None:
+               for row in rows:
+                  validator.checkrow(row, True)
+            csvwriter.writerows(rows)
+            sheet = self.sheets[-1]
+            sheet['items']+=1
+            sheet['bytes']+=size
+      finally:
+         if csvwriter is not None:
+            self.__closesheet__(csvwriter)
+      csvgen.rowcount = sum([sheet['rows'] for sheet in self.sheets])
+      if stats is not None:
+         stats.stop('write', 0, csvgen.rowcount, 'map')
+      csvgen.pathcachestats = csvgen.mappingplan.cachestats()
+      self.writemanifest()
@@ -0,0 +1,121 @@
+import sys
+import time
+try:
+   import resource
+except ImportError:
+   #no resource module on Windows, peak memory isn't reported there
+   resource = None
+
+#peak resident memory of this process so far, in MB
+def peakrssmb():
+   if resource is None:
+      return None
+   peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+   #bytes on Mac OS X, kilobytes everywhere else
+   if sys.platform == 'darwin':
+      return round(peak / (1024.0 * 1024.0), 1)
+   return round(peak / 1024.0, 1)
+
+#the smallest step time.time takes, a microsecond or so on Linux, as much
+#as 16ms on Windows. A stage quicker than that has no rate worth reporting
+def timerresolution(samples=5):
+   resolution = None
+   for sample in range(samples):
+      start = time.time()
+      now = time.time()
+      while now == start:
+         now = time.time()
+      resolution = min(resolution or now - start, now - start)
+   return resolution
+
+TIMERRESOLUTION = timerresolution()
+
+#Times each stage of generating a Rosetta CSV and counts the rows in and out
+#of it. Stages stream into each other, a stage's time includes the time of
+#the stage it reads from, which is taken off again when reporting
+class RosettaCSVStats:
+
+   #order stages are reported in
+   STAGES = ['compile', 'zipname', 'read', 'filter', 'fixity', 'duplicates', 'group', 'map', 'validate', 'write']
+
+   def __init__(self):
+      self.stages = {}
+      self.started = {}
+      #called with (stage, figures) per stage, then ('run', report)
+      self.hooks = []
+
+   def stage(self, stage, includes=None):
+      if stage not in self.stages:
+         self.stages[stage] = { 'seconds': 0.0, 'rowsin': 0, 'rowsout': 0, 'includes': includes, 'peakrssmb': None }
+      return self.stages[stage]
+
+   def add(self, stage, seconds, rowsin=0, rowsout=0, includes=None):
+      figures = self.stage(stage, includes)
+      figures['seconds']+=seconds
+      figures['rowsin']+=rowsin
+      figures['rowsout']+=rowsout
+      figures['peakrssmb'] = max(figures['peakrssmb'], peakrssmb())
+
+   def start(self, stage):
+      self.started[stage] = time.time()
+
+   def stop(self, stage, rowsin=0, rowsout=0, includes=None):
+      self.add(stage, time.time() - self.started.pop(stage), rowsin, rowsout, includes)
+
+   #yields rows unchanged, timing how long each takes to arrive. Totals are
+   #kept in locals and added once the rows run out, not on every row
+   def timed(self, stage, rows, includes=None):
+      self.stage(stage, includes)
+      clock = time.time
+      rows = iter(rows)
+      seconds = 0.0
+      rowsout = 0
+      try:
+         while True:
+            start = clock()
+            try:
+               row = next(rows)
+            finally:
+               seconds += clock() - start
+            rowsout+=1
+            yield row
+      except StopIteration:
+         pass
+      finally:
+         self.add(stage, seconds, 0, rowsout, includes)
+
+   #adds stage figures from another process, e.g. a shard worker
+   def merge(self, stages):
+      for stage, figures in stages.items():
+         self.add(stage, figures['seconds'], figures['rowsin'], figures['rowsout'], figures['includes'])
+         mine = self.stages[stage]
+         mine['peakrssmb'] = max(mine['peakrssmb'], figures['peakrssmb'])
+
+   #a stage's own time, and rows in as the rows out of the stage it reads
+   def stagefigures(self, stage):
+      figures = dict(self.stages[stage])
+      includes = figures.pop('includes')
+      if includes in self.stages:
+         figures['seconds'] = max(0.0, figures['seconds'] - self.stages[includes]['seconds'])
+         figures['rowsin'] = self.stages[includes]['rowsout']
+      seconds = figures['seconds']
+      figures['seconds'] = round(seconds, 4)
+      #the first stage only has rows out
+      rows = figures['rowsin'] or figures['rowsout']
+      figures['rowspersecond'] = round(rows / seconds) if rows and seconds >= TIMERRESOLUTION else None
+      return figures
+
+   def report(self, summary):
+      stages = [stage for stage in self.STAGES if stage in self.stages]
+      stages += sorted([stage for stage in self.stages if stage not in self.STAGES])
+      report = dict(summary)
+      report['stages'] = []
+      for stage in stages:
+         figures = self.stagefigures(stage)
+         for hook in self.hooks:
+            hook(stage, figures)
+         report['stages'].append(dict([('stage', stage)] + figures.items()))
+      report['peakrssmb'] = peakrssmb()
+      for hook in self.hooks:
+         hook('run', report)
+      return report
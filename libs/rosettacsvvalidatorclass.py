@@ -0,0 +1,173 @@
+import re
+import csv
+import struct
+import hashlib
+import cStringIO
+from rosettacsvwriterclass import rosettafieldnames
+from compressedcsvclass import opencsv
+
+#unique values are remembered by a 64 bit digest, not the value itself
+def digest64(value):
+   return struct.unpack('<q', hashlib.md5(value).digest()[:8])[0]
+
+#Checks Rosetta CSV rows against the constraints in the validation schema.
+#Constraints are compiled once into a list of checks per column, rows can
+#then be checked one at a time as they are generated, or read back from a
+#sheet already written. Values are checked as UTF-8 bytes, only decoded
+#where a check needs characters
+class RosettaCSVValidator:
+
+   #violations kept for the report, after this they are only counted
+   MAXVIOLATIONS = 1000
+
+   #values a column has already passed with, so a repeated value isn't
+   #checked again, up to this many per column
+   PASSEDLIMIT = 1024
+
+   #constraints there are checks for, others in a schema, e.g. enum, and a
+   #field's format, are listed in the report as unchecked
+   CONSTRAINTS = ['required', 'pattern', 'minLength', 'maxLength', 'minimum', 'maximum', 'unique']
+
+   def __init__(self, fields):
+      self.names = [field['name'] for field in fields]
+      self.unchecked = []
+      for field in fields:
+         for constraint in sorted(field.get('constraints', {})):
+            if constraint not in self.CONSTRAINTS:
+               self.unchecked.append({ 'column': field['name'], 'constraint': constraint })
+         #the default format is any value of the type
+         if field.get('format', 'default') != 'default':
+            self.unchecked.append({ 'column': field['name'], 'constraint': 'format' })
+      #only columns with something to check, (index, name, required, checks,
+      #values passed). Unique has to see every value so passes aren't kept
+      self.columns = []
+      for index, field in enumerate(fields):
+         required, checks = self.__compile__(field.get('constraints', {}))
+         if required or checks:
+            passed = {}
+            if 'unique' in [constraint for constraint, check in checks]:
+               passed = None
+            self.columns.append((index, field['name'], required, checks, passed))
+      self.rowcount = 0
+      self.violationcount = 0
+      self.violations = []
+      self.counts = {}
+
+   def __compile__(self, constraints):
+      checks = []
+      if 'pattern' in constraints:
+         #a pattern has to match the whole value, not just its start
+         pattern = u'(?:%s)\Z' % constraints['pattern']
+         try:
+            #ASCII patterns can match the UTF-8 bytes as they are
+            regex = re.compile(pattern.encode('ascii'))
+            checks.append(('pattern', lambda value: regex.match(value) is not None))
+         except UnicodeEncodeError:
+            regex = re.compile(pattern, re.UNICODE)
+            checks.append(('pattern', lambda value: regex.match(value.decode('utf-8')) is not None))
+      if 'maxLength' in constraints:
+         maxlength = int(constraints['maxLength'])
+         #never more characters than bytes, only decode if the bytes are over
+         checks.append(('maxLength', lambda value: len(value) <= maxlength or len(value.decode('utf-8')) <= maxlength))
+      if 'minLength' in constraints:
+         minlength = int(constraints['minLength'])
+         checks.append(('minLength', lambda value: len(value.decode('utf-8')) >= minlength))
+      if 'minimum' in constraints:
+         checks.append(('minimum', self.__numbercheck__(lambda number: number >= float(constraints['minimum']))))
+      if 'maximum' in constraints:
+         checks.append(('maximum', self.__numbercheck__(lambda number: number <= float(constraints['maximum']))))
+      if constraints.get('unique'):
+         seen = set()
+         def unique(value):
+            key = digest64(value)
+            if key in seen:
+               return False
+            seen.add(key)
+            return True
+         checks.append(('unique', unique))
+      return constraints.get('required') is True, checks
+
+   def __numbercheck__(self, compare):
+      def check(value):
+         try:
+            return compare(float(value))
+         except ValueError:
+            return False
+      return check
+
+   def __violation__(self, column, constraint, value):
+      self.violationcount+=1
+      counts = self.counts.setdefault(column, {})
+      counts[constraint] = counts.get(constraint, 0) + 1
+      if len(self.violations) < self.MAXVIOLATIONS:
+         self.violations.append({ 'row': self.rowcount, 'column': column, 'constraint': constraint,
+                                  'value': value.decode('utf-8', 'replace') })
+
+   #row is a list of UTF-8 values, or as written, quoted, if quoted is set.
+   #Rows are counted from the SIP row, the first after the header
+   def checkrow(self, row, quoted=False):
+      self.rowcount+=1
+      if len(row) != len(self.names):
+         self.__violation__('', 'columns', str(len(row)))
+         return
+      for index, name, required, checks, passed in self.columns:
+         value = row[index]
+         if quoted:
+            value = value[1:-1]
+         if not value:
+            #empty and not required, nothing else to check
+            if required:
+               self.__violation__(name, 'required', value)
+            continue
+         if passed is not None and value in passed:
+            continue
+         valid = True
+         for constraint, check in checks:
+            if not check(value):
+               self.__violation__(name, constraint, value)
+               valid = False
+         if valid and passed is not None and len(passed) < self.PASSEDLIMIT:
+            passed[value] = True
+
+   #checks the rows generated for each item, yielding them on unchanged
+   def checkitems(self, items):
+      checkrow = self.checkrow
+      for rows in items:
+         for row in rows:
+            checkrow(row, True)
+         yield rows
+
+   #checks rows already rendered to CSV text, e.g. by a shard worker
+   def checktext(self, text):
+      for row in csv.reader(cStringIO.StringIO(text)):
+         self.checkrow(row)
+
+   def checkheader(self, header):
+      if header != rosettafieldnames(self.names):
+         self.__violation__('', 'header', ','.join(header).encode('utf-8'))
+
+   #a standalone pass over a Rosetta CSV already written
+   def checksheet(self, csvfname):
+      with opencsv(csvfname) as csvfile:
+         csvreader = csv.reader(csvfile)
+         for row in csvreader:
+            if csvreader.line_num == 1:
+               self.checkheader([name.decode('utf-8') for name in row])
+            elif row:
+               self.checkrow(row)
+
+   def report(self):
+      return { 'rows': self.rowcount, 'violations': self.violationcount, 'counts': self.counts, 'examples': self.violations,
+               'unchecked': self.unchecked }
+
+#a summary of a validator report, for stderr
+def writevalidation(report, out):
+   for unchecked in report.get('unchecked', []):
+      out.write("WARNING: %s constraint on %s isn't checked.\n" % (unchecked['constraint'].encode('utf-8'), unchecked['column'].encode('utf-8')))
+   out.write("%d rows checked, %d schema violations\n" % (report['rows'], report['violations']))
+   for column in sorted(report['counts']):
+      for constraint, count in sorted(report['counts'][column].items()):
+         out.write("   %s: %s, %d rows\n" % (column.encode('utf-8') or 'row', constraint, count))
+   for violation in report['examples'][:20]:
+      out.write("   row %d, %s: %s, '%s'\n" % (violation['row'], violation['column'].encode('utf-8') or 'row', violation['constraint'],
+                violation['value'].encode('utf-8')))
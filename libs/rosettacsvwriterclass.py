@@ -0,0 +1,70 @@
+import os
+import sys
+from compressedcsvclass import opencsvoutput
+
+#row is a list of already quoted and encoded field values
+def rosettarow(row):
+   return ','.join(row) + '\n'
+
+#ExLibris have named two fields with the same title in CSV which doesn't
+#help us when we're trying to use unique names for populating rows, so the
+#schema says SIP Title and we write the Title (DC) Rosetta expects
+def rosettafieldnames(fieldnames):
+   fieldnames = list(fieldnames)
+   if fieldnames[:2] == ['Object Type', 'SIP Title']:
+      fieldnames[1] = 'Title (DC)'
+   return fieldnames
+
+class RosettaCSVWriter:
+
+   #large buffer, rows are small and we write a great many of them
+   BUFFERSIZE = 1024 * 1024
+
+   #given resumeoffset, the sheet already in outfile is cut back to that
+   #offset and written on from there, see RosettaCSVCheckpoint. outfile is
+   #compressed by its extension, stdout if compressed is gz, bz2 or xz
+   def __init__(self, outfile=False, resumeoffset=None, compressed=None):
+      self.rowcount = 0
+      if outfile and resumeoffset is not None:
+         self.out = open(outfile, 'r+b', self.BUFFERSIZE)
+         self.out.seek(resumeoffset)
+         self.out.truncate()
+         self.closeout = True
+      elif outfile or compressed:
+         #closing a compressed stdout writes the end of the stream, not
+         #closing stdout itself
+         self.out = opencsvoutput(outfile, compressed, sys.stdout)
+         self.closeout = True
+      else:
+         self.out = sys.stdout
+         self.closeout = False
+
+   def rosettaheader(self, fieldnames):
+      return ','.join(['"' + str(name) + '"' for name in rosettafieldnames(fieldnames)])
+
+   def writeheader(self, fieldnames):
+      self.out.write(self.rosettaheader(fieldnames) + '\n')
+
+   def writerow(self, row):
+      self.out.write(rosettarow(row))
+      self.rowcount+=1
+
+   #rows already rendered with rosettarow, e.g. by a worker process
+   def writerendered(self, text, rowcount):
+      self.out.write(text)
+      self.rowcount+=rowcount
+
+   def writerows(self, rows):
+      for row in rows:
+         self.writerow(row)
+
+   #offset of the end of the sheet, once everything written is on disk
+   def sync(self):
+      self.out.flush()
+      os.fsync(self.out.fileno())
+      return self.out.tell()
+
+   def close(self):
+      self.out.flush()
+      if self.closeout:
+         self.out.close()
@@ -0,0 +1,46 @@
+#Bounded cache of raw parent path: transformed Rosetta path. Thousands of
+#files in a DROID report share a parent directory, so each distinct parent
+#is transformed once. Approximates least recently used with two dicts, a
+#recent and an older generation: when recent fills up it becomes the older
+#generation and anything not used since is dropped, so every lookup is a
+#dict lookup, not the bookkeeping of a true LRU
+class RosettaPathCache:
+
+   CACHESIZE = 4096
+
+   def __init__(self, transform, cachesize=CACHESIZE):
+      self.transform = transform
+      self.generationsize = max(1, cachesize // 2)
+      self.recent = {}
+      self.older = {}
+      self.hits = 0
+      self.misses = 0
+
+   def get(self, key):
+      value = self.recent.get(key)
+      if value is not None:
+         self.hits+=1
+         return value
+      value = self.older.get(key)
+      if value is not None:
+         self.hits+=1
+      else:
+         self.misses+=1
+         value = self.transform(key)
+      if len(self.recent) >= self.generationsize:
+         self.older = self.recent
+         self.recent = {}
+      self.recent[key] = value
+      return value
+
+   def resetstats(self):
+      self.hits = 0
+      self.misses = 0
+
+   def stats(self):
+      lookups = self.hits + self.misses
+      hitrate = 0.0
+      if lookups:
+         hitrate = round(float(self.hits) / lookups, 4)
+      return { 'hits': self.hits, 'misses': self.misses, 'hitrate': hitrate,
+               'size': len(self.recent) + len(self.older) }
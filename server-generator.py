@@ -0,0 +1,39 @@
+﻿#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+from libs.rosettacsvserviceclass import RosettaCSVService
+
+def rosettacsvservice(configdir, schemadir, port, socketpath, workers, queuesize, cachedir=False, spooldir=None):
+   service = RosettaCSVService(configdir, schemadir, workers, queuesize, cachedir, spooldir)
+   service.serve(port, socketpath)
+
+def main():
+
+   #	Usage: 	--port [port on localhost] or --socket [unix socket]
+   #	Handle command line arguments for the script
+   parser = argparse.ArgumentParser(description='Serve Rosetta Ingest CSV generation from DROID CSV Reports, with configs and schemas kept compiled.')
+
+   parser.add_argument('--configs', help='Directory of config files jobs can name.', default='rosetta-configs')
+   parser.add_argument('--schemas', help='Directory of Rosetta CSV validation schemas jobs can name.', default='rosetta-schemas')
+   parser.add_argument('--port', help='Port to listen on, on localhost only.', type=int, default=8076)
+   parser.add_argument('--socket', help='Unix socket to listen on instead of a port.', default=None)
+   parser.add_argument('--workers', help='Number of jobs to run at once.', type=int, default=1)
+   parser.add_argument('--queue', help='Number of jobs to hold waiting for a worker, more are turned away.', type=int, default=RosettaCSVService.QUEUESIZE)
+   parser.add_argument('--cache', help='Directory to keep compiled configs and schemas in, reused while they are unchanged.', default=False)
+   parser.add_argument('--spool', help='Directory to write sheets to before they are sent, default is the temporary directory.', default=None)
+
+   #	Parse arguments into namespace object to reference later in the script
+   global args
+   args = parser.parse_args()
+
+   for directory in [args.configs, args.schemas]:
+      if not os.path.isdir(directory):
+         sys.exit("ERROR: " + directory + " isn't a directory.")
+
+   rosettacsvservice(args.configs, args.schemas, args.port, args.socket, args.workers, args.queue, args.cache, args.spool)
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,46 @@
+﻿#!/usr/local/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import argparse
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'JsonTableSchema'))
+import JsonTableSchema
+from libs.rosettacsvvalidatorclass import RosettaCSVValidator, writevalidation
+
+def validatesheet(rosettacsv, rosettaschema, reportfile):
+   with open(rosettaschema, 'rb') as schema:
+      importschema = JsonTableSchema.JSONTableSchema(schema.read())
+   validator = RosettaCSVValidator(importschema.as_dict()['fields'])
+   validator.checksheet(rosettacsv)
+   report = validator.report()
+   writevalidation(report, sys.stderr)
+   if reportfile:
+      with open(reportfile, 'wb') as violations:
+         json.dump(report, violations, indent=2)
+   if report['violations']:
+      sys.exit(1)
+
+def main():
+
+   #	Usage: 	--csv [rosetta csv]
+   #	Handle command line arguments for the script
+   parser = argparse.ArgumentParser(description='Check a Rosetta Ingest CSV against the constraints in a Rosetta CSV validation schema.')
+
+   parser.add_argument('--csv', help='Rosetta CSV to check.', default=False, required=True)
+   parser.add_argument('--ros', help='Rosetta CSV validation schema.', default=False, required=True)
+   parser.add_argument('--report', help='JSON file to write the violations found to.', default=False)
+
+   if len(sys.argv)==1:
+      parser.print_help()
+      sys.exit(1)
+
+   #	Parse arguments into namespace object to reference later in the script
+   global args
+   args = parser.parse_args()
+
+   validatesheet(args.csv, args.ros, args.report)
+
+if __name__ == "__main__":
+   main()